@@ -1,11 +1,21 @@
 import atexit
+import json
 import logging
 import os
+import re
 from dataclasses import dataclass
 
-from flask import Flask, flash, jsonify, redirect, render_template, request, url_for
+from flask import (
+    Flask,
+    Response,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    url_for,
+)
 from flask_login import LoginManager, UserMixin, login_required, login_user, logout_user
-from sqlalchemy import text
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from config import (
@@ -16,9 +26,27 @@ from config import (
     SECRET_KEY,
 )
 from models import Server, ServerBinding, db
+from services import metrics
+from services.history import HistoryWriter, load_history
+from services.leases import make_owner_id
+from services.mc_status import flush_resolve_cache
+from services.migrations import run_migrations
 from services.monitor import ServerMonitor
+from services.server_snapshot import bump_generation, use_shared_store
+from services.settings import number, setting
 from services.onebot_manager import OneBotManager
-from services.state import get_status
+from services.onebot_outbox import OneBotOutbox
+from services.status_store import SharedStatusStore
+from services.tracing import sample_stacks
+from services.state import (
+    all_status,
+    delta_since,
+    get_payload,
+    server_entry,
+    sse_message,
+    subscribe,
+    unsubscribe,
+)
 
 
 @dataclass
@@ -46,6 +74,41 @@ def load_user(user_id):
     return None
 
 
+def build_background(app, status_store=None, leases=None):
+    onebot_defaults = {}
+    outbox = None
+    if setting("ONEBOT_OUTBOX_ENABLED"):
+        # 分片时与租约同名，其他进程据 monitor_workers 判断这些消息的主人是否存活
+        outbox = OneBotOutbox(app, leases.owner if leases is not None else make_owner_id())
+    onebot = OneBotManager(onebot_defaults, outbox=outbox)
+    history = None
+    if setting("HISTORY_ENABLED"):
+        history = HistoryWriter(
+            app,
+            flush_interval=max(1.0, number("HISTORY_FLUSH_INTERVAL")),
+            retention_days=number("HISTORY_RETENTION_DAYS"),
+            rollup_retention_days=number("HISTORY_ROLLUP_RETENTION_DAYS"),
+        )
+        app.extensions["history_writer"] = history
+    monitor = ServerMonitor(
+        app, onebot, onebot_defaults, history=history, status_store=status_store, leases=leases
+    )
+    app.extensions["server_monitor"] = monitor
+    return onebot, history, monitor
+
+
+def start_background(onebot, history, monitor):
+    onebot.start()
+    if history is not None:
+        history.start()
+    monitor.start()
+    # atexit 后注册先执行：先停监控（保存状态），再把历史记录写完，最后关闭 OneBot 连接
+    atexit.register(onebot.stop)
+    if history is not None:
+        atexit.register(history.stop)
+    atexit.register(monitor.stop)
+
+
 def create_app():
     logging.basicConfig(
         level=logging.INFO,
@@ -60,24 +123,21 @@ def create_app():
     login_manager.init_app(app)
 
     with app.app_context():
-        db.create_all()
-        _ensure_server_columns()
-        _ensure_binding_columns()
-        _seed_bindings()
-
-    onebot_defaults = {}
-
-    onebot = OneBotManager(onebot_defaults)
-    monitor = ServerMonitor(app, onebot, onebot_defaults)
-    app.extensions["server_monitor"] = monitor
-
-    def _start_background():
-        onebot.start()
-        monitor.start()
-
-    if not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
-        _start_background()
-        atexit.register(monitor.stop)
+        run_migrations()
+
+    if setting("MONITOR_MODE") == "external":
+        # 监控在 run_monitor.py 中独立运行，本进程只读取共享状态并转发管理操作
+        store = SharedStatusStore(app, poll_interval=max(0.2, number("STATUS_STORE_POLL_INTERVAL")))
+        use_shared_store(store)
+        app.extensions["status_store"] = store
+        app.extensions["server_monitor"] = store
+        onebot = OneBotManager({})
+        if not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            store.follow()
+    else:
+        onebot, history, monitor = build_background(app)
+        if not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            start_background(onebot, history, monitor)
 
     @app.route("/")
     def index():
@@ -134,6 +194,7 @@ def create_app():
         )
         db.session.add(server)
         db.session.commit()
+        bump_generation()
 
         flash("服务器已添加", "success")
         return redirect(url_for("admin"))
@@ -144,6 +205,7 @@ def create_app():
         server = Server.query.get_or_404(server_id)
         db.session.delete(server)
         db.session.commit()
+        bump_generation()
         flash("服务器已删除", "success")
         return redirect(url_for("admin"))
 
@@ -167,6 +229,24 @@ def create_app():
         flash("玩家列表已清空，下次轮询将重新推送上下线", "success")
         return redirect(url_for("admin"))
 
+    # 按需采样监控线程的调用栈，返回 collapsed 格式，可用 flamegraph.pl / speedscope 查看
+    @app.route("/admin/profile")
+    @login_required
+    def admin_profile():
+        monitor = app.extensions.get("server_monitor")
+        thread_id = getattr(monitor, "thread_ident", None)
+        if thread_id is None:
+            message = "监控线程未在本进程运行"
+            if setting("MONITOR_MODE") == "external":
+                message += "，请向 run_monitor.py 发送 SIGUSR1 采样"
+            return Response(message + "\n", status=409, mimetype="text/plain")
+        seconds = _clamp(request.args.get("seconds", type=float), setting("POLL_PROFILE_SECONDS"), 1, 60)
+        interval_ms = _clamp(request.args.get("interval_ms", type=float), 10, 1, 1000)
+        body = sample_stacks(thread_id, seconds, interval_ms / 1000)
+        response = Response(body, mimetype="text/plain")
+        response.headers["Content-Disposition"] = "attachment; filename=monitor-profile.folded"
+        return response
+
     @app.route("/admin/reset_players/<int:server_id>", methods=["POST"])
     @login_required
     def admin_reset_players_one(server_id):
@@ -197,10 +277,37 @@ def create_app():
                 flash("端口必须是数字", "error")
                 return redirect(url_for("admin_edit", server_id=server_id))
 
+            poll_interval = request.form.get("poll_interval", "").strip()
+            try:
+                poll_interval_int = int(poll_interval) if poll_interval else None
+            except ValueError:
+                flash("轮询间隔必须是数字", "error")
+                return redirect(url_for("admin_edit", server_id=server_id))
+            if poll_interval_int is not None and poll_interval_int <= 0:
+                poll_interval_int = None
+
+            timeouts = {}
+            for field in ("connect_timeout", "read_timeout"):
+                value = request.form.get(field, "").strip()
+                try:
+                    timeouts[field] = float(value) if value else None
+                except ValueError:
+                    flash("超时时间必须是数字", "error")
+                    return redirect(url_for("admin_edit", server_id=server_id))
+                if timeouts[field] is not None and timeouts[field] <= 0:
+                    timeouts[field] = None
+
+            old_host = server.host
             server.name = name
             server.host = host
             server.port = port_int
+            server.poll_interval = poll_interval_int
+            server.connect_timeout = timeouts["connect_timeout"]
+            server.read_timeout = timeouts["read_timeout"]
             db.session.commit()
+            bump_generation()
+            flush_resolve_cache(old_host)
+            flush_resolve_cache(host)
 
             flash("服务器已更新", "success")
             return redirect(url_for("admin"))
@@ -246,6 +353,7 @@ def create_app():
         )
         db.session.add(binding)
         db.session.commit()
+        bump_generation()
         flash("绑定已添加", "success")
         return redirect(url_for("admin_bindings", server_id=server.id))
 
@@ -278,6 +386,7 @@ def create_app():
             binding.enable_bluemap = enable_bluemap
             binding.send_screenshot = send_screenshot
             db.session.commit()
+            bump_generation()
 
             flash("绑定已更新", "success")
             return redirect(url_for("admin_bindings", server_id=binding.server_id))
@@ -291,6 +400,7 @@ def create_app():
         server_id = binding.server_id
         db.session.delete(binding)
         db.session.commit()
+        bump_generation()
         flash("绑定已删除", "success")
         return redirect(url_for("admin_bindings", server_id=server_id))
 
@@ -355,147 +465,113 @@ def create_app():
             message=message,
         )
 
+    def _servers_body() -> bytes:
+        payload = get_payload()
+        if payload is not None:
+            return payload[2]
+        # 监控线程尚未完成首轮发布（或未在本进程运行）时按数据库现查
+        servers = Server.query.order_by(Server.id.desc()).all()
+        statuses = all_status()
+        entries = [server_entry(s.id, s.name, s.address(), statuses.get(s.id)) for s in servers]
+        return json.dumps(entries, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
     @app.route("/api/servers")
     def api_servers():
-        servers = Server.query.order_by(Server.id.desc()).all()
-        payload = []
-        for s in servers:
-            status = get_status(s.id) or {}
-            payload.append(
-                {
-                    "id": s.id,
-                    "name": s.name,
-                    "address": s.address(),
-                    "online": status.get("online", False),
-                    "players_online": status.get("players_online", 0),
-                    "players_max": status.get("players_max", 0),
-                    "latency_ms": status.get("latency_ms"),
-                    "players": status.get("players", []),
-                    "players_display": status.get("players_display", []),
-                    "players_known": status.get("players_known", False),
-                    "checked_at": status.get("checked_at"),
-                }
+        since = request.args.get("since", type=int)
+        payload = get_payload()
+        if since is not None:
+            delta = delta_since(since)
+            if delta is not None:
+                response = jsonify(delta)
+                if payload is None:
+                    return response
+                # 增量也带上 ETag；自 since 之后没有变化且客户端持有当前 ETag 时返回 304
+                response.set_etag(payload[1])
+                response.headers["Cache-Control"] = "no-cache"
+                if delta["full"] or delta["servers"] or delta["removed"]:
+                    return response
+                return response.make_conditional(request)
+        if payload is None:
+            return app.response_class(_servers_body(), mimetype="application/json")
+        version, etag, body, generation = payload
+        response = app.response_class(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Status-Version"] = str(version)
+        response.headers["X-Status-Generation"] = str(generation)
+        return response.make_conditional(request)
+
+    @app.route("/api/stream")
+    def api_stream():
+        # 先订阅再取快照，两者之间的更新最多重复一次，不会丢失
+        subscriber = subscribe()
+        snapshot = _servers_body()
+
+        def _events():
+            try:
+                yield sse_message("snapshot", snapshot.decode("utf-8"))
+                while True:
+                    messages, resync = subscriber.drain(SSE_KEEPALIVE_SECONDS)
+                    if resync:
+                        yield sse_message("snapshot", _servers_body().decode("utf-8"))
+                    elif messages:
+                        yield b"".join(messages)
+                    else:
+                        yield b": keepalive\n\n"
+            finally:
+                unsubscribe(subscriber)
+
+        response = Response(_events(), mimetype="text/event-stream")
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
+    # Prometheus 抓取入口；external 模式下监控指标由 run_monitor.py 的 METRICS_PORT 导出
+    @app.route("/metrics")
+    def metrics_endpoint():
+        if not setting("METRICS_ENABLED"):
+            return Response(status=404)
+        return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+    @app.route("/api/servers/<int:server_id>/history")
+    def api_server_history(server_id):
+        Server.query.get_or_404(server_id)
+        range_seconds = _parse_history_range(request.args.get("range", "7d"))
+        if range_seconds is None:
+            return jsonify({"error": "invalid range"}), 400
+        return jsonify(
+            load_history(
+                server_id,
+                range_seconds,
+                hourly_retention_seconds=number("HISTORY_ROLLUP_RETENTION_DAYS") * 86400,
             )
-        return jsonify(payload)
+        )
 
     return app
 
 
-def _ensure_server_columns():
-    expected = {
-        "onebot_ws_url": "TEXT",
-        "onebot_access_token": "TEXT",
-        "onebot_target_type": "TEXT",
-        "onebot_target_id": "TEXT",
-        "enable_onebot": "INTEGER",
-        "notify_player_changes": "INTEGER",
-        "notify_server_status": "INTEGER",
-        "bluemap_url": "TEXT",
-        "enable_bluemap": "INTEGER",
-        "send_screenshot": "INTEGER",
-    }
-    result = db.session.execute(text("PRAGMA table_info(servers)"))
-    existing = {row[1] for row in result.fetchall()}
-    for name, coltype in expected.items():
-        if name not in existing:
-            db.session.execute(text(f"ALTER TABLE servers ADD COLUMN {name} {coltype}"))
-    db.session.execute(text("UPDATE servers SET enable_onebot=1 WHERE enable_onebot IS NULL"))
-    db.session.execute(
-        text("UPDATE servers SET notify_player_changes=1 WHERE notify_player_changes IS NULL")
-    )
-    db.session.execute(
-        text("UPDATE servers SET notify_server_status=1 WHERE notify_server_status IS NULL")
-    )
-    db.session.execute(text("UPDATE servers SET send_screenshot=1 WHERE send_screenshot IS NULL"))
-    db.session.execute(
-        text(
-            "UPDATE servers SET enable_bluemap=1 "
-            "WHERE enable_bluemap IS NULL AND bluemap_url IS NOT NULL AND bluemap_url != ''"
-        )
-    )
-    db.session.commit()
-
-
-def _ensure_binding_columns():
-    result = db.session.execute(text("PRAGMA table_info(server_bindings)"))
-    existing = {row[1] for row in result.fetchall()}
-    if not existing:
-        db.create_all()
-        result = db.session.execute(text("PRAGMA table_info(server_bindings)"))
-        existing = {row[1] for row in result.fetchall()}
-    expected = {
-        "server_id": "INTEGER",
-        "name": "TEXT",
-        "onebot_ws_url": "TEXT",
-        "onebot_access_token": "TEXT",
-        "onebot_target_type": "TEXT",
-        "onebot_target_id": "TEXT",
-        "enable_onebot": "INTEGER",
-        "notify_player_changes": "INTEGER",
-        "notify_server_status": "INTEGER",
-        "bluemap_url": "TEXT",
-        "enable_bluemap": "INTEGER",
-        "send_screenshot": "INTEGER",
-    }
-    for name, coltype in expected.items():
-        if name not in existing:
-            db.session.execute(text(f"ALTER TABLE server_bindings ADD COLUMN {name} {coltype}"))
-    db.session.execute(
-        text("UPDATE server_bindings SET enable_onebot=1 WHERE enable_onebot IS NULL")
-    )
-    db.session.execute(
-        text(
-            "UPDATE server_bindings SET notify_player_changes=1 "
-            "WHERE notify_player_changes IS NULL"
-        )
-    )
-    db.session.execute(
-        text(
-            "UPDATE server_bindings SET notify_server_status=1 "
-            "WHERE notify_server_status IS NULL"
-        )
-    )
-    db.session.execute(
-        text("UPDATE server_bindings SET send_screenshot=1 WHERE send_screenshot IS NULL")
-    )
-    db.session.execute(
-        text(
-            "UPDATE server_bindings SET enable_bluemap=1 "
-            "WHERE enable_bluemap IS NULL AND bluemap_url IS NOT NULL AND bluemap_url != ''"
-        )
-    )
-    db.session.commit()
+SSE_KEEPALIVE_SECONDS = 15
 
+_HISTORY_RANGE_RE = re.compile(r"^(\d+)([hd])$")
+_HISTORY_MAX_RANGE = 366 * 86400
 
-def _seed_bindings():
-    servers = Server.query.all()
-    for server in servers:
-        if server.bindings:
-            continue
-        binding = ServerBinding(
-            server_id=server.id,
-            name="默认",
-            onebot_ws_url=server.onebot_ws_url,
-            onebot_access_token=server.onebot_access_token,
-            onebot_target_type=server.onebot_target_type or "group",
-            onebot_target_id=server.onebot_target_id,
-            enable_onebot=server.enable_onebot if server.enable_onebot is not None else True,
-            notify_player_changes=(
-                server.notify_player_changes if server.notify_player_changes is not None else True
-            ),
-            notify_server_status=(
-                server.notify_server_status if server.notify_server_status is not None else True
-            ),
-            bluemap_url=server.bluemap_url,
-            enable_bluemap=(
-                server.enable_bluemap
-                if server.enable_bluemap is not None
-                else bool(server.bluemap_url)
-            ),
-            send_screenshot=server.send_screenshot if server.send_screenshot is not None else True,
-        )
-        db.session.add(binding)
-    db.session.commit()
+
+def _clamp(value, default, low, high):
+    try:
+        value = float(default if value is None else value)
+    except (TypeError, ValueError):
+        value = float(low)
+    return min(max(value, low), high)
+
+
+def _parse_history_range(value: str):
+    match = _HISTORY_RANGE_RE.match((value or "").strip().lower())
+    if not match:
+        return None
+    seconds = int(match.group(1)) * (3600 if match.group(2) == "h" else 86400)
+    if seconds <= 0:
+        return None
+    return min(seconds, _HISTORY_MAX_RANGE)
 
 
 app = create_app()
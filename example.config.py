@@ -3,9 +3,79 @@ import os
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
 # 基础配置（复制为 config.py 后按需修改）
+# 除数据库、密钥、管理员账号、BLUEMAP_*、QUERY_PORT 与 USE_QUERY_FOR_PLAYERS 外，其余项都可省略，省略时取 services/settings.py 中的默认值
 DATABASE_URL = f"sqlite:///{os.path.join(BASE_DIR, 'data.db')}"
 SECRET_KEY = "change-me"
 POLL_INTERVAL = 10
+# 按服务器自适应轮询间隔（秒）：有人上下线后加速，空服时放慢
+POLL_INTERVAL_ACTIVE = 5
+POLL_ACTIVE_WINDOW = 60
+POLL_INTERVAL_IDLE = 20
+# 轮询时间随机抖动比例，避免所有服务器同时探测
+POLL_JITTER = 0.1
+# 单轮轮询的最大并发探测数（异步 Ping/Query）
+POLL_CONCURRENCY = 32
+# 服务器/绑定列表缓存的兜底复核间隔（秒），后台修改会立即生效
+SERVER_SNAPSHOT_RECHECK = 60
+# 监控状态（在线玩家、上线时间等）定期保存到该文件，重启后恢复；留空表示不保存
+STATE_SNAPSHOT_PATH = os.path.join(BASE_DIR, "monitor_state.json")
+STATE_SNAPSHOT_INTERVAL = 60
+# 快照超过该秒数视为过期，启动时不再恢复
+STATE_SNAPSHOT_MAX_AGE = 300
+
+# 探测超时（秒），可在“编辑服务器”中为单台服务器单独设置
+PROBE_CONNECT_TIMEOUT = 3
+PROBE_READ_TIMEOUT = 3
+# 熔断：连续失败次数达到阈值后暂停探测，冷却期从 BREAKER_OPEN_SECONDS 开始翻倍，最长 BREAKER_MAX_OPEN_SECONDS
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_OPEN_SECONDS = 15
+BREAKER_MAX_OPEN_SECONDS = 60
+
+# 玩家在线会话与服务器采样历史（后台批量写入）
+HISTORY_ENABLED = True
+HISTORY_FLUSH_INTERVAL = 5
+# 历史数据保留天数，0 表示不清理
+HISTORY_RETENTION_DAYS = 30
+# 小时级汇总保留天数（天级汇总长期保留），0 表示不清理
+HISTORY_ROLLUP_RETENTION_DAYS = 365
+
+# 监控运行方式：embedded 在 Web 进程内轮询；external 需另行启动 run_monitor.py，
+# Web 进程（可多个 worker）只从数据库读取监控进程发布的状态
+MONITOR_MODE = "embedded"
+# external 模式下 Web 进程检查新状态的间隔（秒）
+STATUS_STORE_POLL_INTERVAL = 1
+# 多个 run_monitor.py 按租约分担服务器；进程失联超过该秒数后其服务器由其他进程接手
+MONITOR_LEASE_SECONDS = 15
+
+# 分阶段追踪轮询：一轮耗时超过该秒数时输出结构化日志（monitor.trace），0 表示不追踪
+POLL_TRACE_SLOW_SECONDS = 0
+# /admin/profile 与 run_monitor.py 收到 SIGUSR1 时采样监控线程的默认时长（秒）
+POLL_PROFILE_SECONDS = 10
+
+# 是否开放 /metrics（Prometheus 文本格式）
+METRICS_ENABLED = True
+# run_monitor.py 单独导出 /metrics 的端口，0 表示不开启；同一台机器上的多个进程需各用不同端口
+METRICS_PORT = 0
+
+# OneBot 推送：同一目标在合并窗口（秒）内排队的文字消息合并为一条发送，0 表示不等待
+ONEBOT_COALESCE_SECONDS = 1
+# 每个群/私聊每分钟最多发送条数与可突发条数，0 表示不限速
+ONEBOT_TARGET_RATE_PER_MINUTE = 20
+ONEBOT_TARGET_BURST = 5
+# 每条 OneBot 连接（同一地址与 token）每分钟最多发送条数与可突发条数，0 表示不限速
+ONEBOT_CONNECTION_RATE_PER_MINUTE = 60
+ONEBOT_CONNECTION_BURST = 10
+# 每个目标最多排队的消息数；超出时 drop_oldest 丢弃最旧的一条，coalesce 保留已排队的消息、新的文字只在最后一条末尾计数
+ONEBOT_TARGET_QUEUE_LIMIT = 100
+ONEBOT_OVERFLOW_POLICY = "drop_oldest"
+# 未送达的消息保存在数据库中，重启或断线恢复后继续发送，收到 OneBot 成功回执才删除
+ONEBOT_OUTBOX_ENABLED = True
+# 等待回执的秒数，超时视为失败
+ONEBOT_ACK_TIMEOUT = 30
+# 发送失败或回执超时后重试的退避时间（秒），被 OneBot 拒绝的消息不重试；从 BASE 开始翻倍，最长 MAX；最多尝试次数，0 表示一直重试
+ONEBOT_RETRY_BASE_SECONDS = 2
+ONEBOT_RETRY_MAX_SECONDS = 300
+ONEBOT_MAX_ATTEMPTS = 10
 
 # 管理员账号
 ADMIN_USERNAME = "admin"
@@ -15,6 +85,16 @@ ADMIN_PASSWORD_HASH = ""
 # MC Query 配置
 USE_QUERY_FOR_PLAYERS = False
 QUERY_PORT = 0
+# Ping 未返回完整玩家列表时才走 Query；人数不变时 Query 结果最多复用的秒数
+QUERY_MAX_AGE = 60
+# Query challenge token 复用时长（秒），原版服务端约 30 秒清理一次
+QUERY_TOKEN_TTL = 25
+# Query 单独的超时（秒），与 Ping 并行发出，Query 端口不通不会拖慢状态探测
+QUERY_TIMEOUT = 2
+
+# 服务器地址解析缓存（秒），域名不存在时的负缓存时间
+DNS_CACHE_TTL = 300
+DNS_NEGATIVE_TTL = 60
 
 # BlueMap 调试日志
 BLUEMAP_DEBUG = False
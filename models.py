@@ -11,6 +11,9 @@ class Server(db.Model):
     host = db.Column(db.String(255), nullable=False)
     port = db.Column(db.Integer, nullable=False, default=25565)
     enabled = db.Column(db.Boolean, default=True)
+    poll_interval = db.Column(db.Integer, nullable=True)
+    connect_timeout = db.Column(db.Float, nullable=True)
+    read_timeout = db.Column(db.Float, nullable=True)
     onebot_ws_url = db.Column(db.String(255), default="")
     onebot_access_token = db.Column(db.String(255), default="")
     onebot_target_type = db.Column(db.String(20), default="group")
@@ -49,3 +52,99 @@ class ServerBinding(db.Model):
         "Server",
         backref=db.backref("bindings", lazy=True, cascade="all, delete-orphan"),
     )
+
+
+# 以下历史表的时间字段均为 Unix 时间戳（秒），便于按小时/天分桶
+class PlayerSession(db.Model):
+    __tablename__ = "player_sessions"
+    __table_args__ = (
+        db.Index("ix_player_sessions_server_joined", "server_id", "joined_at"),
+        db.Index("ix_player_sessions_open", "server_id", "player", "left_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    server_id = db.Column(db.Integer, nullable=False)
+    player = db.Column(db.String(64), nullable=False)
+    joined_at = db.Column(db.Integer, nullable=False)
+    left_at = db.Column(db.Integer, nullable=True)
+
+
+class ServerSample(db.Model):
+    __tablename__ = "server_samples"
+    __table_args__ = (db.Index("ix_server_samples_server_ts", "server_id", "ts"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    server_id = db.Column(db.Integer, nullable=False)
+    ts = db.Column(db.Integer, nullable=False)
+    online = db.Column(db.Boolean, nullable=False)
+    players_online = db.Column(db.Integer, nullable=False, default=0)
+    latency_ms = db.Column(db.Integer, nullable=True)
+
+
+# 延迟直方图分桶上界（毫秒），最后一桶为 >= 最大上界
+LATENCY_BUCKETS_MS = (10, 25, 50, 75, 100, 150, 200, 300, 500, 1000)
+
+# 按小时/天增量维护的采样汇总，period 为桶长度（秒），bucket_start 为桶起点时间戳
+server_rollups = db.Table(
+    "server_rollups",
+    db.Column("server_id", db.Integer, primary_key=True),
+    db.Column("period", db.Integer, primary_key=True),
+    db.Column("bucket_start", db.Integer, primary_key=True),
+    db.Column("samples", db.Integer, nullable=False, default=0),
+    db.Column("online_samples", db.Integer, nullable=False, default=0),
+    db.Column("players_sum", db.Integer, nullable=False, default=0),
+    db.Column("players_peak", db.Integer, nullable=False, default=0),
+    *[
+        db.Column(f"latency_{i}", db.Integer, nullable=False, default=0)
+        for i in range(len(LATENCY_BUCKETS_MS) + 1)
+    ],
+)
+
+
+# 监控进程发布给 Web 进程的单台服务器状态条目；generation 取自全局计数器 status_generation
+server_status = db.Table(
+    "server_status",
+    db.Column("server_id", db.Integer, primary_key=True),
+    db.Column("generation", db.Integer, nullable=False, index=True),
+    db.Column("entry", db.Text, nullable=False),
+    db.Column("updated_at", db.Float, nullable=False),
+)
+
+# 多个监控进程按租约分担服务器；state 为持有者定期保存的监控状态，换主时由新持有者恢复
+server_leases = db.Table(
+    "server_leases",
+    db.Column("server_id", db.Integer, primary_key=True),
+    db.Column("owner", db.String(128), nullable=True, index=True),
+    db.Column("expires_at", db.Float, nullable=False, default=0),
+    db.Column("heartbeat_at", db.Float, nullable=False, default=0),
+    db.Column("state", db.Text, nullable=True),
+)
+
+monitor_workers = db.Table(
+    "monitor_workers",
+    db.Column("owner", db.String(128), primary_key=True),
+    db.Column("started_at", db.Float, nullable=False),
+    db.Column("heartbeat_at", db.Float, nullable=False),
+)
+
+# Web 进程通知监控进程的计数器（服务器列表变更、清空玩家列表等），值只增不减
+monitor_signals = db.Table(
+    "monitor_signals",
+    db.Column("name", db.String(64), primary_key=True),
+    db.Column("value", db.Integer, nullable=False, default=0),
+)
+
+# OneBot 待确认消息：入队即写入，收到 echo 成功回执后删除；owner 为所属进程，
+# 进程失联后其余进程（或重启后的新进程）接手重发
+onebot_outbox = db.Table(
+    "onebot_outbox",
+    db.Column("key", db.String(32), primary_key=True),
+    db.Column("owner", db.String(128), nullable=False, index=True),
+    db.Column("ws_url", db.Text, nullable=False),
+    db.Column("access_token", db.Text, nullable=True),
+    db.Column("target_type", db.String(20), nullable=False),
+    db.Column("target_id", db.BigInteger, nullable=False),
+    db.Column("message", db.Text, nullable=False),
+    db.Column("attempts", db.Integer, nullable=False, default=0),
+    db.Column("created_at", db.Float, nullable=False),
+)
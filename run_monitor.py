@@ -0,0 +1,66 @@
+import logging
+import os
+import signal
+import threading
+import time
+
+from services import metrics
+from services.leases import ServerLeases, make_owner_id
+from services.settings import number, setting
+from services.status_store import SharedStatusStore
+from services.tracing import sample_stacks
+
+
+# 收到 SIGUSR1 时在后台采样监控线程，结果写入当前目录
+def _profile_monitor(monitor, logger):
+    thread_id = monitor.thread_ident
+    if thread_id is None:
+        return
+    seconds = min(max(number("POLL_PROFILE_SECONDS"), 1.0), 60.0)
+    path = f"monitor-profile-{os.getpid()}-{int(time.time())}.folded"
+    logger.info("Sampling monitor thread for %.0fs", seconds)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(sample_stacks(thread_id, seconds))
+    logger.info("Monitor profile written to %s", os.path.abspath(path))
+
+
+# 独立运行监控、OneBot 推送与历史记录，状态写入数据库供 Web 进程读取；
+# 可同时启动多个，按数据库租约分担服务器
+def main():
+    # 非 external 模式下导入 app 时就会启动内置监控，再启动一套会重复轮询和推送
+    monitor_mode = setting("MONITOR_MODE")
+    if monitor_mode != "external":
+        raise SystemExit(f'run_monitor.py requires MONITOR_MODE = "external" (current: {monitor_mode!r})')
+    from app import app, build_background, start_background
+
+    logger = logging.getLogger("run_monitor")
+    store = app.extensions.get("status_store") or SharedStatusStore(app)
+    # 独立进程只负责写入，不跟随自己发布的状态
+    store.stop()
+    lease_seconds = max(3.0, number("MONITOR_LEASE_SECONDS"))
+    leases = ServerLeases(store.engine, make_owner_id(), lease_seconds)
+    logger.info("Monitor worker %s started", leases.owner)
+    onebot, history, monitor = build_background(app, status_store=store, leases=leases)
+    start_background(onebot, history, monitor)
+    metrics_port = int(number("METRICS_PORT"))
+    if setting("METRICS_ENABLED") and metrics_port > 0:
+        metrics.serve("0.0.0.0", metrics_port)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(
+            signal.SIGUSR1,
+            lambda *_: threading.Thread(
+                target=_profile_monitor, args=(monitor, logger), daemon=True
+            ).start(),
+        )
+    try:
+        while not stop.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
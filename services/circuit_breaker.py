@@ -0,0 +1,52 @@
+from datetime import datetime
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+# 连续失败 threshold 次后熔断，冷却期内跳过探测；冷却结束进入半开状态，只放行第一个试探，
+# 同一主机的其他服务器等试探结果：成功则恢复，失败则冷却时间翻倍（不超过 max_open_seconds）
+class CircuitBreaker:
+    def __init__(self, threshold: int, open_seconds: float, max_open_seconds: float):
+        self.threshold = max(1, threshold)
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max(open_seconds, max_open_seconds)
+        self.state = CLOSED
+        self.failures = 0
+        self.retry_at = 0.0
+        self._open_for = open_seconds
+
+    def allow(self, now: float) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and now >= self.retry_at:
+            self.state = HALF_OPEN
+            return True
+        return False
+
+    def record_success(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.retry_at = 0.0
+        self._open_for = self.open_seconds
+
+    def record_failure(self, now: float):
+        self.failures += 1
+        if self.state == HALF_OPEN:
+            self._open_for = min(self._open_for * 2, self.max_open_seconds)
+        elif self.failures < self.threshold:
+            return
+        self.state = OPEN
+        self.retry_at = now + self._open_for
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "retry_at": (
+                datetime.utcfromtimestamp(self.retry_at).isoformat() + "Z"
+                if self.state == OPEN
+                else None
+            ),
+        }
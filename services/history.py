@@ -0,0 +1,391 @@
+import logging
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import text
+
+from models import LATENCY_BUCKETS_MS, db
+
+_INSERT_SAMPLE = text(
+    "INSERT INTO server_samples (server_id, ts, online, players_online, latency_ms) "
+    "VALUES (:server_id, :ts, :online, :players_online, :latency_ms)"
+)
+# 已有未结束的会话时不重复插入（重启或清空玩家列表后再次“上线”会接上原会话）
+_OPEN_SESSION = text(
+    "INSERT INTO player_sessions (server_id, player, joined_at) "
+    "SELECT :server_id, :player, :ts WHERE NOT EXISTS ("
+    "SELECT 1 FROM player_sessions "
+    "WHERE server_id = :server_id AND player = :player AND left_at IS NULL)"
+)
+_CLOSE_SESSION = text(
+    "UPDATE player_sessions SET left_at = :ts "
+    "WHERE server_id = :server_id AND player = :player AND left_at IS NULL"
+)
+_CLOSE_ALL_SESSIONS = text(
+    "UPDATE player_sessions SET left_at = :ts WHERE server_id = :server_id AND left_at IS NULL"
+)
+# 监控停止期间被删除或停用的服务器收不到离线事件，定期结束其未关闭的会话
+_CLOSE_UNMONITORED_SESSIONS = text(
+    "UPDATE player_sessions SET left_at = :ts "
+    "WHERE left_at IS NULL AND server_id NOT IN (SELECT id FROM servers WHERE enabled = 1)"
+)
+# 已删除服务器的历史无法再通过接口查询，清理时一并删除
+_HISTORY_TABLES = ("player_sessions", "server_samples", "server_rollups")
+
+_PRUNE_EVERY = 3600
+
+HOUR = 3600
+DAY = 86400
+# 按本地时区切分天桶，与管理后台看到的日期一致
+_TZ_OFFSET = time.localtime().tm_gmtoff
+
+_LATENCY_COLUMNS = tuple(f"latency_{i}" for i in range(len(LATENCY_BUCKETS_MS) + 1))
+_SUM_COLUMNS = ("samples", "online_samples", "players_sum") + _LATENCY_COLUMNS
+_ROLLUP_COLUMNS = ("server_id", "period", "bucket_start", "players_peak") + _SUM_COLUMNS
+# 每批采样先在内存中按桶聚合，再一次 upsert 累加到汇总表
+_UPSERT_ROLLUP = text(
+    f"INSERT INTO server_rollups ({', '.join(_ROLLUP_COLUMNS)}) "
+    f"VALUES ({', '.join(':' + c for c in _ROLLUP_COLUMNS)}) "
+    "ON CONFLICT(server_id, period, bucket_start) DO UPDATE SET "
+    "players_peak = MAX(players_peak, excluded.players_peak), "
+    + ", ".join(f"{c} = {c} + excluded.{c}" for c in _SUM_COLUMNS)
+)
+
+
+def _bucket_start(ts: int, period: int) -> int:
+    return (ts + _TZ_OFFSET) // period * period - _TZ_OFFSET
+
+
+def _latency_case_sql() -> str:
+    bounds = (0,) + LATENCY_BUCKETS_MS
+    parts = []
+    for i, column in enumerate(_LATENCY_COLUMNS):
+        cond = f"online AND latency_ms IS NOT NULL AND latency_ms >= {bounds[i]}"
+        if i < len(LATENCY_BUCKETS_MS):
+            cond += f" AND latency_ms < {LATENCY_BUCKETS_MS[i]}"
+        parts.append(f"SUM(CASE WHEN {cond} THEN 1 ELSE 0 END)")
+    return ", ".join(parts)
+
+
+# 汇总表为空时从原始采样一次性补算（升级前已记录的数据）
+_BACKFILL_ROLLUP = text(
+    f"INSERT INTO server_rollups ({', '.join(_ROLLUP_COLUMNS)}) "
+    "SELECT server_id, :period, (ts + :offset) / :period * :period - :offset AS bucket, "
+    "MAX(CASE WHEN online THEN players_online ELSE 0 END), COUNT(*), SUM(online), "
+    "SUM(CASE WHEN online THEN players_online ELSE 0 END), "
+    + _latency_case_sql()
+    + " FROM server_samples GROUP BY server_id, bucket"
+)
+
+
+# 监控线程只往内存队列追加记录，后台线程每隔 flush_interval 秒批量写入 SQLite
+class HistoryWriter:
+    def __init__(
+        self,
+        app,
+        flush_interval: float,
+        retention_days: float,
+        rollup_retention_days: float = 0,
+        max_pending: int = 100000,
+    ):
+        self.app = app
+        self._flush_interval = flush_interval
+        self._retention_seconds = retention_days * 86400 if retention_days > 0 else 0
+        self._rollup_retention_seconds = (
+            rollup_retention_days * 86400 if rollup_retention_days > 0 else 0
+        )
+        self._max_pending = max_pending
+        self._pending = deque()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_prune = 0.0
+        self._dropped = 0
+        self._logger = logging.getLogger("history")
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def record_sample(self, server_id: int, ts: float, online: bool, players_online: int, latency_ms):
+        self._append(
+            (
+                "sample",
+                {
+                    "server_id": server_id,
+                    "ts": int(ts),
+                    "online": bool(online),
+                    "players_online": players_online or 0,
+                    "latency_ms": latency_ms,
+                },
+            )
+        )
+
+    def record_join(self, server_id: int, player: str, ts: float):
+        self._append(("open", {"server_id": server_id, "player": player, "ts": int(ts)}))
+
+    def record_leave(self, server_id: int, player: str, ts: float):
+        self._append(("close", {"server_id": server_id, "player": player, "ts": int(ts)}))
+
+    def close_all(self, server_id: int, ts: float):
+        self._append(("close_all", {"server_id": server_id, "ts": int(ts)}))
+
+    # 同步某台服务器当前在线玩家：关闭不在列表中的会话，并为列表中的玩家补开会话
+    def sync_online(self, server_id: int, players, ts: float):
+        self._append(("sync", {"server_id": server_id, "players": tuple(players), "ts": int(ts)}))
+
+    def _append(self, item):
+        if len(self._pending) >= self._max_pending:
+            self._pending.popleft()
+            self._dropped += 1
+        self._pending.append(item)
+
+    def _run(self):
+        self._maybe_backfill()
+        while not self._stop.wait(self._flush_interval):
+            self.flush()
+            self._maybe_prune()
+
+    def flush(self):
+        with self._flush_lock:
+            batch = []
+            while self._pending:
+                batch.append(self._pending.popleft())
+            if not batch:
+                return
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as conn:
+                        self._write_batch(conn, batch)
+            except Exception:
+                self._logger.exception("History flush failed, %d records dropped", len(batch))
+            if self._dropped:
+                self._logger.warning("History queue overflow, %d records dropped", self._dropped)
+                self._dropped = 0
+
+    @staticmethod
+    def _write_batch(conn, batch: list):
+        samples = [params for kind, params in batch if kind == "sample"]
+        if samples:
+            conn.execute(_INSERT_SAMPLE, samples)
+            conn.execute(_UPSERT_ROLLUP, HistoryWriter._aggregate(samples))
+
+        # 会话操作需保持先后顺序，连续的同类操作合并为一次 executemany
+        run_kind = None
+        run = []
+        for kind, params in batch:
+            if kind == "sample":
+                continue
+            if kind == "sync":
+                HistoryWriter._flush_run(conn, run_kind, run)
+                run_kind, run = None, []
+                HistoryWriter._sync_online(conn, params)
+                continue
+            if kind != run_kind:
+                HistoryWriter._flush_run(conn, run_kind, run)
+                run_kind, run = kind, []
+            run.append(params)
+        HistoryWriter._flush_run(conn, run_kind, run)
+
+    @staticmethod
+    def _aggregate(samples: list) -> list:
+        rows = {}
+        for sample in samples:
+            online = sample["online"]
+            players = sample["players_online"] if online else 0
+            latency = sample["latency_ms"]
+            for period in (HOUR, DAY):
+                key = (sample["server_id"], period, _bucket_start(sample["ts"], period))
+                row = rows.get(key)
+                if row is None:
+                    row = dict.fromkeys(_SUM_COLUMNS, 0)
+                    row.update(server_id=key[0], period=period, bucket_start=key[2], players_peak=0)
+                    rows[key] = row
+                row["samples"] += 1
+                if not online:
+                    continue
+                row["online_samples"] += 1
+                row["players_sum"] += players
+                if players > row["players_peak"]:
+                    row["players_peak"] = players
+                if latency is not None:
+                    row[_LATENCY_COLUMNS[bisect_right(LATENCY_BUCKETS_MS, latency)]] += 1
+        return list(rows.values())
+
+    @staticmethod
+    def _flush_run(conn, kind, run: list):
+        if not run:
+            return
+        statement = {
+            "open": _OPEN_SESSION,
+            "close": _CLOSE_SESSION,
+            "close_all": _CLOSE_ALL_SESSIONS,
+        }[kind]
+        conn.execute(statement, run)
+
+    @staticmethod
+    def _sync_online(conn, params: dict):
+        players = params["players"]
+        rows = conn.execute(
+            text(
+                "SELECT player FROM player_sessions "
+                "WHERE server_id = :server_id AND left_at IS NULL"
+            ),
+            {"server_id": params["server_id"]},
+        ).fetchall()
+        online = set(players)
+        stale = [
+            {"server_id": params["server_id"], "player": row[0], "ts": params["ts"]}
+            for row in rows
+            if row[0] not in online
+        ]
+        if stale:
+            conn.execute(_CLOSE_SESSION, stale)
+        if players:
+            conn.execute(
+                _OPEN_SESSION,
+                [{"server_id": params["server_id"], "player": p, "ts": params["ts"]} for p in players],
+            )
+
+    def _maybe_backfill(self):
+        with self._flush_lock:
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as conn:
+                        if conn.execute(text("SELECT 1 FROM server_rollups LIMIT 1")).first():
+                            return
+                        if not conn.execute(text("SELECT 1 FROM server_samples LIMIT 1")).first():
+                            return
+                        for period in (HOUR, DAY):
+                            conn.execute(_BACKFILL_ROLLUP, {"period": period, "offset": _TZ_OFFSET})
+                self._logger.info("History rollups backfilled from raw samples")
+            except Exception:
+                self._logger.exception("History rollup backfill failed")
+
+    def _maybe_prune(self):
+        now = time.time()
+        if now - self._last_prune < _PRUNE_EVERY:
+            return
+        self._last_prune = now
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(_CLOSE_UNMONITORED_SESSIONS, {"ts": int(now)})
+                    for table in _HISTORY_TABLES:
+                        conn.execute(
+                            text(f"DELETE FROM {table} WHERE server_id NOT IN (SELECT id FROM servers)")
+                        )
+                    if self._retention_seconds:
+                        cutoff = int(now - self._retention_seconds)
+                        conn.execute(
+                            text("DELETE FROM server_samples WHERE ts < :cutoff"), {"cutoff": cutoff}
+                        )
+                        conn.execute(
+                            text(
+                                "DELETE FROM player_sessions "
+                                "WHERE left_at IS NOT NULL AND left_at < :cutoff"
+                            ),
+                            {"cutoff": cutoff},
+                        )
+                    # 天级汇总体积很小，长期保留；只清理过期的小时级汇总
+                    if self._rollup_retention_seconds:
+                        conn.execute(
+                            text(
+                                "DELETE FROM server_rollups "
+                                "WHERE period = :period AND bucket_start < :cutoff"
+                            ),
+                            {"period": HOUR, "cutoff": int(now - self._rollup_retention_seconds)},
+                        )
+        except Exception:
+            self._logger.exception("History prune failed")
+
+
+def _percentile(row, q: float):
+    counts = [row[c] for c in _LATENCY_COLUMNS]
+    total = sum(counts)
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    lower = 0
+    for i, count in enumerate(counts):
+        if count and seen + count >= target:
+            if i == len(LATENCY_BUCKETS_MS):
+                return float(lower)
+            upper = LATENCY_BUCKETS_MS[i]
+            return round(lower + (upper - lower) * (target - seen) / count, 1)
+        seen += count
+        if i < len(LATENCY_BUCKETS_MS):
+            lower = LATENCY_BUCKETS_MS[i]
+    return float(lower)
+
+
+def _stats(row) -> dict:
+    samples = row["samples"]
+    online = row["online_samples"]
+    return {
+        "samples": samples,
+        "uptime": round(online * 100.0 / samples, 2) if samples else None,
+        "peak_players": row["players_peak"],
+        "avg_players": round(row["players_sum"] / online, 2) if online else None,
+        "latency_p50": _percentile(row, 0.5),
+        "latency_p95": _percentile(row, 0.95),
+    }
+
+
+def _point(row) -> dict:
+    point = {"start": datetime.utcfromtimestamp(row["bucket_start"]).isoformat() + "Z"}
+    point.update(_stats(row))
+    return point
+
+
+def _merge(rows: list) -> dict:
+    merged = dict.fromkeys(_SUM_COLUMNS, 0)
+    merged["players_peak"] = 0
+    for row in rows:
+        for c in _SUM_COLUMNS:
+            merged[c] += row[c]
+        merged["players_peak"] = max(merged["players_peak"], row["players_peak"])
+    return merged
+
+
+# 读取某台服务器最近 range_seconds 内的小时/天汇总，需在 app context 中调用；
+# 范围仍在小时级汇总保留期内（hourly_retention_seconds，0 表示不清理）时按小时统计 summary，
+# 否则天桶会把范围外的整天也算进去
+def load_history(
+    server_id: int, range_seconds: int, now: float = None, hourly_retention_seconds: float = 0
+) -> dict:
+    now = int(now if now is not None else time.time())
+    result = {"server_id": server_id, "range_seconds": range_seconds}
+    hourly_summary = hourly_retention_seconds <= 0 or range_seconds <= hourly_retention_seconds
+    for key, period in (("hourly", HOUR), ("daily", DAY)):
+        rows = (
+            db.session.execute(
+                text(
+                    f"SELECT bucket_start, players_peak, {', '.join(_SUM_COLUMNS)} "
+                    "FROM server_rollups "
+                    "WHERE server_id = :server_id AND period = :period AND bucket_start >= :since "
+                    "ORDER BY bucket_start"
+                ),
+                {
+                    "server_id": server_id,
+                    "period": period,
+                    "since": _bucket_start(now - range_seconds, period),
+                },
+            )
+            .mappings()
+            .all()
+        )
+        result[key] = [_point(row) for row in rows]
+        if (key == "hourly") == hourly_summary:
+            result["summary"] = _stats(_merge(rows))
+    return result
@@ -0,0 +1,165 @@
+import json
+import math
+import os
+import socket
+import uuid
+
+from sqlalchemy import bindparam, text
+
+from services.status_store import next_status_generation
+
+_UPSERT_WORKER = text(
+    "INSERT INTO monitor_workers (owner, started_at, heartbeat_at) VALUES (:owner, :now, :now) "
+    "ON CONFLICT(owner) DO UPDATE SET heartbeat_at = :now"
+)
+_SAVE_STATE = text(
+    "UPDATE server_leases SET expires_at = :expires, heartbeat_at = :now, "
+    "state = COALESCE(:state, state) "
+    "WHERE server_id = :server_id AND owner = :owner"
+)
+_RELEASE = text(
+    "UPDATE server_leases SET owner = NULL, expires_at = 0, state = COALESCE(:state, state) "
+    "WHERE server_id = :server_id AND owner = :owner"
+)
+# 条件更新保证同一时刻只有一个进程能拿到租约
+_CLAIM = text(
+    "UPDATE server_leases SET owner = :owner, expires_at = :expires, heartbeat_at = :now "
+    "WHERE server_id = :server_id AND (owner IS NULL OR expires_at < :now)"
+)
+
+
+def make_owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+# 多个监控进程通过数据库租约分担服务器：每个进程定期心跳、续租并保存所持服务器的状态，
+# 按存活进程数均分；进程退出或超时后，其服务器由其他进程接手并恢复状态
+class ServerLeases:
+    def __init__(self, engine, owner: str, lease_seconds: float):
+        self._engine = engine
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+
+    # 返回 (本进程持有的服务器 id 集合, 新接手服务器的已保存状态 {id: record|None})
+    def heartbeat(self, now: float, states: dict, held: set):
+        expires = now + self.lease_seconds
+        with self._engine.begin() as conn:
+            # 第一条语句即写入，立即取得写锁，多个进程的心跳串行执行
+            conn.execute(_UPSERT_WORKER, {"owner": self.owner, "now": now})
+            conn.execute(
+                text("DELETE FROM monitor_workers WHERE heartbeat_at < :cutoff"),
+                {"cutoff": now - self.lease_seconds},
+            )
+            workers = conn.execute(text("SELECT COUNT(*) FROM monitor_workers")).scalar() or 1
+
+            total = self._sync_rows(conn)
+
+            rows = conn.execute(
+                text("SELECT server_id FROM server_leases WHERE owner = :owner"),
+                {"owner": self.owner},
+            ).fetchall()
+            mine = {row[0] for row in rows}
+            if mine:
+                conn.execute(
+                    _SAVE_STATE,
+                    [
+                        {
+                            "server_id": sid,
+                            "owner": self.owner,
+                            "expires": expires,
+                            "now": now,
+                            "state": _dump(states.get(sid)),
+                        }
+                        for sid in mine
+                    ],
+                )
+
+            share = math.ceil(total / workers)
+            if len(mine) > share:
+                # 有新进程加入：交出多余的服务器（连同最新状态）
+                extra = sorted(mine, reverse=True)[: len(mine) - share]
+                conn.execute(
+                    _RELEASE,
+                    [
+                        {"server_id": sid, "owner": self.owner, "state": _dump(states.get(sid))}
+                        for sid in extra
+                    ],
+                )
+                mine.difference_update(extra)
+
+            if len(mine) < share:
+                free = conn.execute(
+                    text(
+                        "SELECT server_id FROM server_leases "
+                        "WHERE owner IS NULL OR expires_at < :now ORDER BY server_id LIMIT :limit"
+                    ),
+                    {"now": now, "limit": share - len(mine)},
+                ).fetchall()
+                for (sid,) in free:
+                    claimed = conn.execute(
+                        _CLAIM,
+                        {"server_id": sid, "owner": self.owner, "expires": expires, "now": now},
+                    ).rowcount
+                    if claimed:
+                        mine.add(sid)
+
+            claimed_states = {}
+            new_ids = mine - held
+            if new_ids:
+                rows = conn.execute(
+                    text(
+                        "SELECT server_id, state FROM server_leases WHERE server_id IN :ids"
+                    ).bindparams(bindparam("ids", expanding=True)),
+                    {"ids": sorted(new_ids)},
+                ).fetchall()
+                claimed_states = {sid: json.loads(state) if state else None for sid, state in rows}
+        return mine, claimed_states
+
+    # 以 servers 表为准同步租约行：新启用的服务器补行，已删除或停用的连同其发布的状态一起清除；
+    # 返回需要分配的服务器总数
+    @staticmethod
+    def _sync_rows(conn) -> int:
+        conn.execute(
+            text(
+                "INSERT OR IGNORE INTO server_leases (server_id, owner, expires_at, heartbeat_at) "
+                "SELECT id, NULL, 0, 0 FROM servers WHERE enabled = 1"
+            )
+        )
+        conn.execute(
+            text(
+                "DELETE FROM server_leases "
+                "WHERE server_id NOT IN (SELECT id FROM servers WHERE enabled = 1)"
+            )
+        )
+        deleted = conn.execute(
+            text(
+                "DELETE FROM server_status "
+                "WHERE server_id NOT IN (SELECT id FROM servers WHERE enabled = 1)"
+            )
+        ).rowcount
+        if deleted:
+            next_status_generation(conn)
+        return conn.execute(text("SELECT COUNT(*) FROM server_leases")).scalar() or 0
+
+    # 正常退出时交出全部租约，其他进程下一次心跳即可接手
+    def release_all(self, states: dict):
+        with self._engine.begin() as conn:
+            rows = conn.execute(
+                text("SELECT server_id FROM server_leases WHERE owner = :owner"),
+                {"owner": self.owner},
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    _RELEASE,
+                    [
+                        {"server_id": sid, "owner": self.owner, "state": _dump(states.get(sid))}
+                        for (sid,) in rows
+                    ],
+                )
+            conn.execute(text("DELETE FROM monitor_workers WHERE owner = :owner"), {"owner": self.owner})
+
+
+def _dump(record):
+    if record is None:
+        return None
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
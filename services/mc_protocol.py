@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict
+
+from mcstatus import JavaServer
+
+# 下面用到的是 mcstatus 的内部模块（连接已解析 ip 但握手写原始主机名、限制包长度、复用 Query token 都靠它们），
+# 小版本之间也可能调整；导入失败时退回公开的 JavaServer 接口，探测照常进行，只是少了上述优化。
+# tests/test_mc_protocol.py 会在内部接口变化时直接失败
+try:
+    from mcstatus._net.address import Address
+    from mcstatus._protocol.io.connection import TCPAsyncSocketConnection, UDPAsyncSocketConnection
+    from mcstatus._protocol.java_client import AsyncJavaClient
+    from mcstatus._protocol.query_client import AsyncQueryClient
+except ImportError:
+    INTERNALS_AVAILABLE = False
+    logging.getLogger("mc_status").warning(
+        "mcstatus internals not found, falling back to the public JavaServer API"
+    )
+else:
+    INTERNALS_AVAILABLE = True
+
+# 状态查询不关心具体协议版本，与 mcstatus 的默认值一致
+PROTOCOL_VERSION = 47
+
+# 正常的状态响应（含 favicon 与模组列表）远小于此；服务端给出的长度超过上限时直接断开，
+# 避免恶意服务器让监控进程按它声明的长度持续接收数据
+MAX_PACKET_BYTES = 1 << 20
+
+
+if INTERNALS_AVAILABLE:
+
+    class _BoundedConnection(TCPAsyncSocketConnection):
+        __slots__ = ()
+
+        async def read_bytearray(self) -> bytes:
+            length = await self.read_varint()
+            if length < 0 or length > MAX_PACKET_BYTES:
+                raise OSError(f"Refusing packet of {length} bytes")
+            return await self.read(length)
+
+
+def _parse_status(status) -> Dict[str, Any]:
+    sample = status.players.sample
+    return {
+        "players_online": int(status.players.online or 0),
+        "players_max": int(status.players.max or 0),
+        "sample": [p.name for p in sample] if sample is not None else None,
+    }
+
+
+# 连接已解析的 ip，但握手包里仍写原始主机名，保证代理端的 forced host 正常工作；
+# 延迟取状态之后的 ping/pong 往返，服务端不响应 ping 时退回状态请求的往返时间
+async def async_read_status(
+    ip: str, port: int, handshake_host: str, connect_timeout: float, read_timeout: float
+) -> Dict[str, Any]:
+    if not INTERNALS_AVAILABLE:
+        return await _public_read_status(ip, port, connect_timeout, read_timeout)
+    connection = _BoundedConnection(Address(ip, port), connect_timeout)
+    await connection.connect()
+    try:
+        connection.timeout = read_timeout
+        client = AsyncJavaClient(connection, address=Address(handshake_host, port), version=PROTOCOL_VERSION)
+        await client.handshake()
+        status = await asyncio.wait_for(client.read_status(), timeout=read_timeout)
+        latency = status.latency
+        try:
+            latency = await asyncio.wait_for(client.test_ping(), timeout=read_timeout)
+        except (OSError, asyncio.TimeoutError):
+            pass
+    finally:
+        try:
+            await connection.close()
+        except Exception:
+            pass
+
+    result = _parse_status(status)
+    result["latency_ms"] = int(latency) if latency is not None else None
+    return result
+
+
+# 公开接口只有一个超时，握手写的是 ip，也不限制包长度
+async def _public_read_status(
+    ip: str, port: int, connect_timeout: float, read_timeout: float
+) -> Dict[str, Any]:
+    server = JavaServer(ip, port, timeout=max(connect_timeout, read_timeout))
+    status = await asyncio.wait_for(server.async_status(tries=1), timeout=connect_timeout + read_timeout)
+    result = _parse_status(status)
+    result["latency_ms"] = int(status.latency) if status.latency is not None else None
+    return result
+
+
+# 固定本地端口的 UT3 Query 会话：原版服务端按来源地址校验 challenge token，
+# 只要 socket 不变，token 在过期前都可以直接复用，省掉一次握手往返
+class QuerySession:
+    def __init__(self, ip: str, port: int, token_ttl: float):
+        self.ip = ip
+        self.port = port
+        self.loop = None
+        self.last_used = 0.0
+        self.closed = False
+        self._token_ttl = token_ttl
+        self._token_at = 0.0
+        self._rtt = None
+        self._connection = None
+        self._client = None
+        self._lock = None
+
+    def close(self):
+        self.closed = True
+        self._reset()
+
+    # 超时后可能还有迟到的回包留在 socket 里，mcstatus 按顺序读取不做匹配，只能换一个 socket
+    def _reset(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+        self._connection = None
+        self._client = None
+
+    async def _ensure_open(self, timeout: float):
+        if self._client is not None:
+            return
+        connection = UDPAsyncSocketConnection(Address(self.ip, self.port), timeout)
+        await connection.connect()
+        self._connection = connection
+        self._client = AsyncQueryClient(connection)
+        self._token_at = 0.0
+
+    async def _handshake(self, timeout: float):
+        self._connection.timeout = timeout
+        start = time.perf_counter()
+        await self._client.handshake()
+        self._rtt = time.perf_counter() - start
+        self._token_at = time.monotonic()
+
+    async def _full_stat(self, timeout: float) -> list:
+        self._connection.timeout = timeout
+        response = await self._client.read_query()
+        return list(response.players.list)
+
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        return remaining
+
+    # 每次读取的超时取到 deadline 为止的剩余时间，整次 Query 不超过 timeout；
+    # 不再套一层 wait_for，取消时不会卡在内层读超时上
+    async def read_players(self, timeout: float) -> list:
+        if not INTERNALS_AVAILABLE:
+            self.last_used = time.monotonic()
+            server = JavaServer(self.ip, self.port, timeout=timeout, query_port=self.port)
+            response = await server.async_query(tries=1)
+            return list(response.players.list)
+        deadline = time.monotonic() + timeout
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self.last_used = time.monotonic()
+            try:
+                await self._ensure_open(self._remaining(deadline))
+                if self._token_at and time.monotonic() - self._token_at < self._token_ttl:
+                    # token 可能已被服务端提前清理（原版不会回包），只等几个 RTT 就回退到重新握手
+                    fast_timeout = min(self._remaining(deadline), max(0.3, (self._rtt or 0.1) * 4))
+                    try:
+                        return await self._full_stat(fast_timeout)
+                    except asyncio.TimeoutError:
+                        self._reset()
+                        await self._ensure_open(self._remaining(deadline))
+                await self._handshake(self._remaining(deadline))
+                return await self._full_stat(self._remaining(deadline))
+            except BaseException:
+                self._reset()
+                raise
@@ -1,60 +1,288 @@
+import asyncio
+import ipaddress
 import socket
-from typing import Any, Dict, List, Optional
-
-from mcstatus import JavaServer
-
-
-def _safe_player_list(sample) -> List[str]:
-    if not sample:
-        return []
-    names = []
-    for p in sample:
-        name = getattr(p, "name", None)
-        if name:
-            names.append(name)
-    return names
-
-
-def query_java_status(host: str, port: int, use_query_for_players: bool, query_port: int) -> Dict[str, Any]:
-    address = f"{host}:{port}"
-    server = JavaServer.lookup(address)
-
-    status = server.status()
-    players_online = status.players.online
-    players_max = status.players.max
-    latency_ms = int(status.latency) if status.latency is not None else None
-    players_known = status.players.sample is not None
-    players: Optional[List[str]] = _safe_player_list(status.players.sample) if players_known else []
-
-    if use_query_for_players:
-        try:
-            query_server = JavaServer.lookup(f"{host}:{query_port or port}")
-            query = query_server.query()
-            if query and query.players and query.players.names is not None:
-                players = list(query.players.names)
-                players_known = True
-        except Exception:
-            pass
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
 
+from services.mc_protocol import QuerySession, async_read_status
+from services.settings import number
+
+_RESOLVE_CACHE_MAX = 4096
+_QUERY_SESSION_IDLE = 300
+_NEGATIVE_ERRNOS = {
+    getattr(socket, "EAI_NONAME", None),
+    getattr(socket, "EAI_NODATA", None),
+}
+
+# (host, port) -> (expires_at, (ip, port) | None)，None 表示域名不存在（负缓存）
+_resolve_cache: Dict[Tuple[str, int], Tuple[float, Optional[Tuple[str, int]]]] = {}
+_resolve_lock = threading.Lock()
+
+# (ip, query_port) -> QuerySession，复用 UDP socket 与 challenge token
+_query_sessions: Dict[Tuple[str, int], QuerySession] = {}
+# (host, port, query_port) -> (fetched_at, players_online, players)
+_query_results: Dict[Tuple[str, int, int], Tuple[float, int, Tuple[str, ...]]] = {}
+# (host, port, query_port) -> 上次 Ping 的 sample 是否已包含全部玩家
+_sample_complete: Dict[Tuple[str, int, int], bool] = {}
+# 上次状态探测失败的 (host, port, query_port)，恢复前不再与 Ping 并行发 Query
+_last_offline: set = set()
+_query_lock = threading.Lock()
+
+# 轮询追踪开启时由调用方在当前任务中设置为 [0.0]，实际发起的 DNS 解析耗时（缓存命中不计）累加到其中
+resolve_timing: ContextVar[Optional[List[float]]] = ContextVar("resolve_timing", default=None)
+
+
+_positive_ttl = number("DNS_CACHE_TTL")
+_negative_ttl = number("DNS_NEGATIVE_TTL")
+_query_max_age = number("QUERY_MAX_AGE")
+_query_token_ttl = number("QUERY_TOKEN_TTL")
+_query_timeout = number("QUERY_TIMEOUT", positive=True)
+_connect_timeout = number("PROBE_CONNECT_TIMEOUT", positive=True)
+_read_timeout = number("PROBE_READ_TIMEOUT", positive=True)
+
+
+def flush_resolve_cache(host: str | None = None):
+    with _resolve_lock:
+        if host is None:
+            _resolve_cache.clear()
+            with _query_lock:
+                _query_results.clear()
+                _sample_complete.clear()
+                _last_offline.clear()
+            return
+        host = host.strip().lower()
+        for key in [k for k in _resolve_cache if k[0] == host]:
+            _resolve_cache.pop(key, None)
+    with _query_lock:
+        for key in [k for k in _query_results if k[0] == host]:
+            _query_results.pop(key, None)
+        for key in [k for k in _sample_complete if k[0] == host]:
+            _sample_complete.pop(key, None)
+        for key in [k for k in _last_offline if k[0] == host]:
+            _last_offline.discard(key)
+
+
+def _store_resolved(key: Tuple[str, int], target: Optional[Tuple[str, int]], ttl: float):
+    if ttl <= 0:
+        return
+    now = time.monotonic()
+    with _resolve_lock:
+        if len(_resolve_cache) >= _RESOLVE_CACHE_MAX:
+            for k in [k for k, (expires, _) in _resolve_cache.items() if expires <= now]:
+                _resolve_cache.pop(k, None)
+            if len(_resolve_cache) >= _RESOLVE_CACHE_MAX:
+                _resolve_cache.pop(next(iter(_resolve_cache)))
+        _resolve_cache[key] = (now + ttl, target)
+
+
+async def async_resolve_target(host: str, port: int) -> Tuple[str, int]:
+    host = host.strip().lower()
+    try:
+        ipaddress.ip_address(host)
+        return host, port
+    except ValueError:
+        pass
+
+    key = (host, port)
+    with _resolve_lock:
+        cached = _resolve_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        if cached[1] is None:
+            raise OSError(f"Unknown host {host} (cached)")
+        return cached[1]
+
+    loop = asyncio.get_running_loop()
+    timing = resolve_timing.get()
+    started = time.perf_counter()
+    try:
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as exc:
+        if exc.errno in _NEGATIVE_ERRNOS:
+            _store_resolved(key, None, _negative_ttl)
+        raise
+    finally:
+        if timing is not None:
+            timing[0] += time.perf_counter() - started
+    # 与 mcstatus 一致，优先使用 IPv4
+    infos.sort(key=lambda info: info[0] != socket.AF_INET)
+    target = (infos[0][4][0], port)
+    _store_resolved(key, target, _positive_ttl)
+    return target
+
+
+def _build_result(status: Dict[str, Any], players: Optional[List[str]], players_known: bool) -> Dict[str, Any]:
     return {
         "online": True,
-        "players_online": players_online,
-        "players_max": players_max,
-        "latency_ms": latency_ms,
+        "players_online": status["players_online"],
+        "players_max": status["players_max"],
+        "latency_ms": status["latency_ms"],
         "players": players,
         "players_known": players_known,
     }
 
 
-def fetch_status(host: str, port: int, use_query_for_players: bool, query_port: int) -> Dict[str, Any]:
+def _offline_result() -> Dict[str, Any]:
+    return {
+        "online": False,
+        "players_online": 0,
+        "players_max": 0,
+        "latency_ms": None,
+        "players": [],
+        "players_known": False,
+    }
+
+
+def _get_query_session(ip: str, port: int) -> QuerySession:
+    loop = asyncio.get_running_loop()
+    now = time.monotonic()
+    with _query_lock:
+        session = _query_sessions.get((ip, port))
+        if session is None or session.loop is not loop or session.closed:
+            session = QuerySession(ip, port, _query_token_ttl)
+            session.loop = loop
+            _query_sessions[(ip, port)] = session
+        for key, idle in list(_query_sessions.items()):
+            if idle is not session and now - idle.last_used > _QUERY_SESSION_IDLE:
+                _query_sessions.pop(key, None)
+                if idle.loop is loop:
+                    idle.close()
+    return session
+
+
+# 事件循环关闭前调用，释放绑定在该循环上的 Query socket
+def close_query_sessions(loop):
+    with _query_lock:
+        for key, session in list(_query_sessions.items()):
+            if session.loop is loop:
+                _query_sessions.pop(key, None)
+                session.close()
+
+
+def _sample_is_complete(status: Dict[str, Any]) -> bool:
+    if status["players_online"] == 0:
+        return True
+    sample = status["sample"]
+    if sample is None or len(sample) < status["players_online"]:
+        return False
+    return all(name and name != "Anonymous Player" for name in sample)
+
+
+def _query_due(key: Tuple[str, int, int]) -> bool:
+    with _query_lock:
+        if _sample_complete.get(key) or key in _last_offline:
+            return False
+        cached = _query_results.get(key)
+    return cached is None or time.monotonic() - cached[0] >= _query_max_age
+
+
+async def _read_query_players(ip: str, port: int) -> List[str]:
+    session = _get_query_session(ip, port)
+    return await session.read_players(_query_timeout)
+
+
+def _consume_result(task: asyncio.Task):
+    if not task.cancelled():
+        task.exception()
+
+
+# 取消不再需要的 Query 后直接返回，不等它结束；回调取走结果，避免 asyncio 报告未读取的异常
+def _discard(task: Optional[asyncio.Task]):
+    if task is None:
+        return
+    task.cancel()
+    task.add_done_callback(_consume_result)
+
+
+async def async_query_java_status(
+    host: str,
+    port: int,
+    use_query_for_players: bool,
+    query_port: int,
+    connect_timeout: float | None = None,
+    read_timeout: float | None = None,
+) -> Dict[str, Any]:
+    ip, _ = await async_resolve_target(host, port)
+    key = (host.strip().lower(), port, query_port or port)
+
+    # 已知本轮一定要 Query 时与 Ping 同时发出，两者各自超时，耗时取较慢的一方；
+    # 上次离线的服务器先等 Ping 成功再 Query，离线时探测耗时只取决于 Ping
+    query_task = None
+    if use_query_for_players and _query_due(key):
+        query_task = asyncio.create_task(_read_query_players(ip, query_port or port))
+
+    try:
+        status = await async_read_status(
+            ip,
+            port,
+            host,
+            connect_timeout or _connect_timeout,
+            read_timeout or _read_timeout,
+        )
+    except BaseException:
+        _discard(query_task)
+        with _query_lock:
+            _last_offline.add(key)
+        raise
+    with _query_lock:
+        _last_offline.discard(key)
+    players_known = status["sample"] is not None
+    players: Optional[List[str]] = [n for n in status["sample"] if n] if players_known else []
+
+    if not use_query_for_players:
+        return _build_result(status, players, players_known)
+
+    complete = _sample_is_complete(status)
+    with _query_lock:
+        _sample_complete[key] = complete
+        cached = _query_results.get(key)
+    # Ping 的 sample 已包含全部玩家时无需 Query；人数不变且结果未过期时复用上次的 Query 列表
+    if complete:
+        _discard(query_task)
+        return _build_result(status, players, players_known)
+
+    now = time.monotonic()
+    if query_task is None and cached and cached[1] == status["players_online"] and now - cached[0] < _query_max_age:
+        return _build_result(status, list(cached[2]), True)
+
+    if query_task is None:
+        query_task = asyncio.create_task(_read_query_players(ip, query_port or port))
     try:
-        return query_java_status(host, port, use_query_for_players, query_port)
+        players = await query_task
+        players_known = True
+        with _query_lock:
+            _query_results[key] = (now, status["players_online"], tuple(players))
+    except Exception:
+        pass
+
+    return _build_result(status, players, players_known)
+
+
+async def async_fetch_status(
+    host: str,
+    port: int,
+    use_query_for_players: bool,
+    query_port: int,
+    connect_timeout: float | None = None,
+    read_timeout: float | None = None,
+) -> Dict[str, Any]:
+    try:
+        return await async_query_java_status(
+            host, port, use_query_for_players, query_port, connect_timeout, read_timeout
+        )
     except (socket.timeout, OSError, Exception):
-        return {
-            "online": False,
-            "players_online": 0,
-            "players_max": 0,
-            "latency_ms": None,
-            "players": [],
-            "players_known": False,
-        }
+        return _offline_result()
+
+
+def fetch_status(
+    host: str,
+    port: int,
+    use_query_for_players: bool,
+    query_port: int,
+    connect_timeout: float | None = None,
+    read_timeout: float | None = None,
+) -> Dict[str, Any]:
+    return asyncio.run(
+        async_fetch_status(host, port, use_query_for_players, query_port, connect_timeout, read_timeout)
+    )
@@ -0,0 +1,191 @@
+import logging
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 7.5, 10)
+
+# 进程内指标注册表，按 Prometheus 文本格式导出；
+# 调用方预先取好带标签的子项并缓存，热路径上只做数值加法，不查表也不分配对象。
+# 每个子项基本只有一个写入线程，不加锁
+_families = {}
+_families_lock = threading.Lock()
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name: str, labels: str):
+        yield f"{name}{labels} {_fmt(self.value)}"
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    # 导出时才调用 function 取值（例如队列长度），平时零开销
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self, name: str, labels: str):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                return
+        yield f"{name}{labels} {_fmt(value)}"
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str, labels: str):
+        inner = labels[1:-1] + "," if labels else ""
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{inner}le="{_fmt(bound)}"}} {cumulative}'
+        yield f'{name}_bucket{{{inner}le="+Inf"}} {self.count}'
+        yield f"{name}_sum{labels} {_fmt(self.sum)}"
+        yield f"{name}_count{labels} {self.count}"
+
+
+class MetricFamily:
+    def __init__(self, name: str, kind: str, documentation: str, label_names: tuple, factory):
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.label_names = label_names
+        self._factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    # 无标签指标用 labels() 取唯一的子项
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._factory()
+                    self._children[key] = child
+        return child
+
+    def remove(self, *values):
+        with self._lock:
+            self._children.pop(tuple(str(v) for v in values), None)
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for key, child in list(self._children.items()):
+            labels = ""
+            if key:
+                labels = "{" + ",".join(
+                    f'{label}="{_escape(value)}"' for label, value in zip(self.label_names, key)
+                ) + "}"
+            lines.extend(child.samples(self.name, labels))
+        return lines
+
+
+def _register(name: str, kind: str, documentation: str, label_names, factory) -> MetricFamily:
+    with _families_lock:
+        family = _families.get(name)
+        if family is None:
+            family = MetricFamily(name, kind, documentation, tuple(label_names), factory)
+            _families[name] = family
+        return family
+
+
+def counter(name: str, documentation: str, label_names=()) -> MetricFamily:
+    return _register(name, "counter", documentation, label_names, _CounterChild)
+
+
+def gauge(name: str, documentation: str, label_names=()) -> MetricFamily:
+    return _register(name, "gauge", documentation, label_names, _GaugeChild)
+
+
+def histogram(name: str, documentation: str, label_names=(), buckets=DEFAULT_BUCKETS) -> MetricFamily:
+    bounds = tuple(sorted(float(b) for b in buckets))
+    return _register(name, "histogram", documentation, label_names, lambda: _HistogramChild(bounds))
+
+
+def render() -> bytes:
+    with _families_lock:
+        families = list(_families.values())
+    lines = []
+    for family in families:
+        lines.extend(family.render())
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+# 独立监控进程没有 Web 服务，单独开一个端口导出 /metrics
+def serve(host: str, port: int):
+    logger = logging.getLogger("metrics")
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as exc:
+        logger.error("Failed to serve metrics on %s:%s: %s", host, port, exc)
+        return None
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info("Serving metrics on %s:%s", host, port)
+    return server
@@ -0,0 +1,294 @@
+import logging
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import db
+
+_logger = logging.getLogger("migrations")
+
+_SERVER_COLUMNS = {
+    "poll_interval": "INTEGER",
+    "connect_timeout": "REAL",
+    "read_timeout": "REAL",
+    "onebot_ws_url": "TEXT",
+    "onebot_access_token": "TEXT",
+    "onebot_target_type": "TEXT",
+    "onebot_target_id": "TEXT",
+    "enable_onebot": "INTEGER",
+    "notify_player_changes": "INTEGER",
+    "notify_server_status": "INTEGER",
+    "bluemap_url": "TEXT",
+    "enable_bluemap": "INTEGER",
+    "send_screenshot": "INTEGER",
+}
+
+_BINDING_COLUMNS = {
+    "server_id": "INTEGER",
+    "name": "TEXT",
+    "onebot_ws_url": "TEXT",
+    "onebot_access_token": "TEXT",
+    "onebot_target_type": "TEXT",
+    "onebot_target_id": "TEXT",
+    "enable_onebot": "INTEGER",
+    "notify_player_changes": "INTEGER",
+    "notify_server_status": "INTEGER",
+    "bluemap_url": "TEXT",
+    "enable_bluemap": "INTEGER",
+    "send_screenshot": "INTEGER",
+}
+
+
+def _add_missing_columns(conn, table: str, expected: dict):
+    existing = {row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))}
+    for name, coltype in expected.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {coltype}"))
+
+
+def _fill_default_flags(conn, table: str):
+    for column in ("enable_onebot", "notify_player_changes", "notify_server_status", "send_screenshot"):
+        conn.execute(text(f"UPDATE {table} SET {column}=1 WHERE {column} IS NULL"))
+    conn.execute(
+        text(
+            f"UPDATE {table} SET enable_bluemap=1 "
+            "WHERE enable_bluemap IS NULL AND bluemap_url IS NOT NULL AND bluemap_url != ''"
+        )
+    )
+
+
+def _execute_all(conn, statements: tuple):
+    for statement in statements:
+        conn.exec_driver_sql(statement)
+
+
+# 以下各步骤的建表语句固定为该版本时的表结构，之后模型再变化也不能回头修改，只能追加新步骤；
+# 全部使用 IF NOT EXISTS，兼容引入版本号之前由 create_all 建好部分表的旧数据库
+
+# 1：服务器与绑定表；补齐旧版数据库缺少的列，并为空值填充默认开关
+_V1_TABLES = (
+    "CREATE TABLE IF NOT EXISTS servers ("
+    "id INTEGER NOT NULL, "
+    "name VARCHAR(120) NOT NULL, "
+    "host VARCHAR(255) NOT NULL, "
+    "port INTEGER NOT NULL, "
+    "enabled BOOLEAN, "
+    "poll_interval INTEGER, "
+    "connect_timeout FLOAT, "
+    "read_timeout FLOAT, "
+    "onebot_ws_url VARCHAR(255), "
+    "onebot_access_token VARCHAR(255), "
+    "onebot_target_type VARCHAR(20), "
+    "onebot_target_id VARCHAR(50), "
+    "enable_onebot BOOLEAN, "
+    "notify_player_changes BOOLEAN, "
+    "notify_server_status BOOLEAN, "
+    "bluemap_url VARCHAR(255), "
+    "enable_bluemap BOOLEAN, "
+    "send_screenshot BOOLEAN, "
+    "created_at DATETIME DEFAULT CURRENT_TIMESTAMP, "
+    "PRIMARY KEY (id))",
+    "CREATE TABLE IF NOT EXISTS server_bindings ("
+    "id INTEGER NOT NULL, "
+    "server_id INTEGER NOT NULL, "
+    "name VARCHAR(120) NOT NULL, "
+    "onebot_ws_url VARCHAR(255), "
+    "onebot_access_token VARCHAR(255), "
+    "onebot_target_type VARCHAR(20), "
+    "onebot_target_id VARCHAR(50), "
+    "enable_onebot BOOLEAN, "
+    "notify_player_changes BOOLEAN, "
+    "notify_server_status BOOLEAN, "
+    "bluemap_url VARCHAR(255), "
+    "enable_bluemap BOOLEAN, "
+    "send_screenshot BOOLEAN, "
+    "created_at DATETIME DEFAULT CURRENT_TIMESTAMP, "
+    "PRIMARY KEY (id), "
+    "FOREIGN KEY(server_id) REFERENCES servers (id))",
+    "CREATE INDEX IF NOT EXISTS ix_server_bindings_server_id ON server_bindings (server_id)",
+)
+
+
+def _migrate_legacy_columns(conn):
+    _execute_all(conn, _V1_TABLES)
+    _add_missing_columns(conn, "servers", _SERVER_COLUMNS)
+    _add_missing_columns(conn, "server_bindings", _BINDING_COLUMNS)
+    _fill_default_flags(conn, "servers")
+    _fill_default_flags(conn, "server_bindings")
+
+
+# 2：把旧版写在服务器上的推送配置迁移为“默认”绑定；只用 SQL，不依赖之后会变化的 ORM 模型
+_SEED_BINDINGS = text(
+    "INSERT INTO server_bindings (server_id, name, onebot_ws_url, onebot_access_token, "
+    "onebot_target_type, onebot_target_id, enable_onebot, notify_player_changes, "
+    "notify_server_status, bluemap_url, enable_bluemap, send_screenshot) "
+    "SELECT id, :name, onebot_ws_url, onebot_access_token, COALESCE(onebot_target_type, 'group'), "
+    "onebot_target_id, COALESCE(enable_onebot, 1), COALESCE(notify_player_changes, 1), "
+    "COALESCE(notify_server_status, 1), bluemap_url, "
+    "COALESCE(enable_bluemap, CASE WHEN bluemap_url IS NOT NULL AND bluemap_url != '' THEN 1 ELSE 0 END), "
+    "COALESCE(send_screenshot, 1) "
+    "FROM servers WHERE NOT EXISTS (SELECT 1 FROM server_bindings WHERE server_id = servers.id)"
+)
+
+
+def _migrate_seed_bindings(conn):
+    conn.execute(_SEED_BINDINGS, {"name": "默认"})
+
+
+# 3：历史记录与汇总表
+_V3_TABLES = (
+    "CREATE TABLE IF NOT EXISTS player_sessions ("
+    "id INTEGER NOT NULL, "
+    "server_id INTEGER NOT NULL, "
+    "player VARCHAR(64) NOT NULL, "
+    "joined_at INTEGER NOT NULL, "
+    "left_at INTEGER, "
+    "PRIMARY KEY (id))",
+    "CREATE INDEX IF NOT EXISTS ix_player_sessions_open ON player_sessions (server_id, player, left_at)",
+    "CREATE INDEX IF NOT EXISTS ix_player_sessions_server_joined ON player_sessions (server_id, joined_at)",
+    "CREATE TABLE IF NOT EXISTS server_samples ("
+    "id INTEGER NOT NULL, "
+    "server_id INTEGER NOT NULL, "
+    "ts INTEGER NOT NULL, "
+    "online BOOLEAN NOT NULL, "
+    "players_online INTEGER NOT NULL, "
+    "latency_ms INTEGER, "
+    "PRIMARY KEY (id))",
+    "CREATE INDEX IF NOT EXISTS ix_server_samples_server_ts ON server_samples (server_id, ts)",
+    "CREATE TABLE IF NOT EXISTS server_rollups ("
+    "server_id INTEGER NOT NULL, "
+    "period INTEGER NOT NULL, "
+    "bucket_start INTEGER NOT NULL, "
+    "samples INTEGER NOT NULL, "
+    "online_samples INTEGER NOT NULL, "
+    "players_sum INTEGER NOT NULL, "
+    "players_peak INTEGER NOT NULL, "
+    + "".join(f"latency_{i} INTEGER NOT NULL, " for i in range(11))
+    + "PRIMARY KEY (server_id, period, bucket_start))",
+)
+
+
+def _migrate_history_tables(conn):
+    _execute_all(conn, _V3_TABLES)
+
+
+# 4：Web 进程通知独立监控进程的信号表
+_V4_TABLES = (
+    "CREATE TABLE IF NOT EXISTS monitor_signals ("
+    "name VARCHAR(64) NOT NULL, "
+    "value INTEGER NOT NULL, "
+    "PRIMARY KEY (name))",
+)
+
+
+def _migrate_status_store_tables(conn):
+    _execute_all(conn, _V4_TABLES)
+
+
+# 5：按服务器分行发布的共享状态表与监控进程租约表
+_V5_TABLES = (
+    "CREATE TABLE IF NOT EXISTS server_status ("
+    "server_id INTEGER NOT NULL, "
+    "generation INTEGER NOT NULL, "
+    "entry TEXT NOT NULL, "
+    "updated_at FLOAT NOT NULL, "
+    "PRIMARY KEY (server_id))",
+    "CREATE INDEX IF NOT EXISTS ix_server_status_generation ON server_status (generation)",
+    "CREATE TABLE IF NOT EXISTS server_leases ("
+    "server_id INTEGER NOT NULL, "
+    "owner VARCHAR(128), "
+    "expires_at FLOAT NOT NULL, "
+    "heartbeat_at FLOAT NOT NULL, "
+    "state TEXT, "
+    "PRIMARY KEY (server_id))",
+    "CREATE INDEX IF NOT EXISTS ix_server_leases_owner ON server_leases (owner)",
+    "CREATE TABLE IF NOT EXISTS monitor_workers ("
+    "owner VARCHAR(128) NOT NULL, "
+    "started_at FLOAT NOT NULL, "
+    "heartbeat_at FLOAT NOT NULL, "
+    "PRIMARY KEY (owner))",
+)
+
+
+def _migrate_sharded_monitor_tables(conn):
+    _execute_all(conn, _V5_TABLES)
+
+
+# 6：OneBot 持久化发件箱
+_V6_TABLES = (
+    "CREATE TABLE IF NOT EXISTS onebot_outbox ("
+    '"key" VARCHAR(32) NOT NULL, '
+    "owner VARCHAR(128) NOT NULL, "
+    "ws_url TEXT NOT NULL, "
+    "access_token TEXT, "
+    "target_type VARCHAR(20) NOT NULL, "
+    "target_id BIGINT NOT NULL, "
+    "message TEXT NOT NULL, "
+    "attempts INTEGER NOT NULL, "
+    "created_at FLOAT NOT NULL, "
+    'PRIMARY KEY ("key"))',
+    "CREATE INDEX IF NOT EXISTS ix_onebot_outbox_owner ON onebot_outbox (owner)",
+)
+
+
+def _migrate_onebot_outbox(conn):
+    _execute_all(conn, _V6_TABLES)
+
+
+# 按版本号顺序执行，只能追加不能修改已有步骤
+MIGRATIONS = (
+    (1, _migrate_legacy_columns),
+    (2, _migrate_seed_bindings),
+    (3, _migrate_history_tables),
+    (4, _migrate_status_store_tables),
+    (5, _migrate_sharded_monitor_tables),
+    (6, _migrate_onebot_outbox),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _read_version(conn):
+    try:
+        row = conn.execute(text("SELECT version FROM schema_version")).first()
+    except OperationalError:
+        return None
+    return row[0] if row else 0
+
+
+def _write_version(conn, version: int):
+    conn.execute(text("DELETE FROM schema_version"))
+    conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {"v": version})
+
+
+# 每个步骤连同版本号在一个事务中提交，失败时整步回滚，数据库停留在上一个完整版本；
+# pysqlite 不会在建表语句前自动开启事务，这里显式 BEGIN IMMEDIATE，同时让并发启动的进程排队，
+# 拿到写锁后重新读取版本号，已被其他进程完成的步骤直接跳过
+def _run_step(step_version: int, step) -> bool:
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        conn.exec_driver_sql("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+        if _read_version(conn) >= step_version:
+            conn.rollback()
+            return False
+        step(conn)
+        _write_version(conn, step_version)
+        conn.commit()
+    return True
+
+
+# 已是最新版本时只读一次 schema_version，启动耗时与数据量无关；需在 app context 中调用。
+# 全新数据库与旧版数据库走同一套步骤
+def run_migrations():
+    with db.engine.connect() as conn:
+        version = _read_version(conn)
+    if version == SCHEMA_VERSION:
+        return
+    if version is not None and version > SCHEMA_VERSION:
+        _logger.warning("Database schema version %s is newer than %s", version, SCHEMA_VERSION)
+        return
+
+    for step_version, step in MIGRATIONS:
+        if version is not None and step_version <= version:
+            continue
+        if _run_step(step_version, step):
+            _logger.info("Database migrated to schema version %s", step_version)
@@ -1,38 +1,134 @@
+import asyncio
+import heapq
 import json
 import logging
+import random
 import threading
 import time
 from datetime import datetime
 from urllib.request import urlopen
 
 
-from services.mc_status import fetch_status
-from services.state import update_status
+from services import metrics
+from services.circuit_breaker import HALF_OPEN, OPEN, CircuitBreaker
+from services.mc_status import (
+    async_fetch_status,
+    close_query_sessions,
+    flush_resolve_cache,
+    resolve_timing,
+)
+from services.server_snapshot import current_generation, load_enabled_servers
+from services.server_state import ServerState, intern_name, load_states, save_states
+from services.settings import number, setting
+from services.state import commit_status, publish_payload, server_entry, update_status
+from services.status_store import RESET_ALL_SIGNAL, SERVERS_SIGNAL
 from services.time_utils import format_duration
-from models import Server
+from services.tracing import (
+    DIFF,
+    NOTIFY,
+    PHASES,
+    PROBE,
+    PUBLISH,
+    SNAPSHOT,
+    UPDATE_STATUS,
+    CycleTrace,
+)
 from config import (
     BLUEMAP_DEBUG,
     BLUEMAP_RUNTIME_IDLE_SECONDS,
-    POLL_INTERVAL,
     QUERY_PORT,
     USE_QUERY_FOR_PLAYERS,
 )
 
 
+FETCH_SECONDS = metrics.histogram(
+    "mc_fetch_status_seconds", "Time spent probing one server", ("server_id",)
+)
+POLL_CYCLE_SECONDS = metrics.histogram(
+    "mc_poll_cycle_seconds", "Duration of poll cycles that probed at least one server"
+).labels()
+POLL_CYCLE_OVERRUNS = metrics.counter(
+    "mc_poll_cycle_overruns_total", "Poll cycles that took longer than the shortest probe interval"
+).labels()
+POLL_PHASE_SECONDS = metrics.histogram(
+    "mc_poll_phase_seconds", "Time spent in each phase of traced poll cycles", ("phase",)
+)
+BLUEMAP_CAPTURE_SECONDS = metrics.histogram(
+    "bluemap_capture_seconds",
+    "Duration of BlueMap screenshot captures",
+    buckets=(0.5, 1, 2, 5, 10, 15, 20, 30, 60),
+).labels()
+BLUEMAP_LOCK_WAIT_SECONDS = metrics.histogram(
+    "bluemap_capture_lock_wait_seconds", "Time spent waiting for the BlueMap capture lock"
+).labels()
+BLUEMAP_BROWSER_RESTARTS = metrics.counter(
+    "bluemap_browser_restarts_total", "Headless browser launches for BlueMap captures"
+).labels()
+
+
+# 退出时等待监控线程结束的最长秒数，超过后照常保存状态
+_STOP_JOIN_SECONDS = 15
+
+
 class ServerMonitor:
-    def __init__(self, app, onebot, onebot_defaults: dict):
+    def __init__(
+        self, app, onebot, onebot_defaults: dict, history=None, status_store=None, leases=None
+    ):
         self.app = app
         self.onebot = onebot
+        self.history = history
+        self._status_store = status_store
+        self._signals = None
+        self._leases = leases
+        self._owned = set()
+        self._lease_expires = 0.0
+        self._lease_renew_at = 0.0
         self._onebot_defaults = onebot_defaults
         self._thread = None
         self._stop = threading.Event()
-        self._last_players = {}
-        self._last_counts = {}
-        self._player_seen_at = {}
-        self._last_online = {}
-        self._offline_since = {}
-        self._last_polled = {}
+        self._event_loop = None
+        try:
+            concurrency = int(setting("POLL_CONCURRENCY"))
+        except (TypeError, ValueError):
+            concurrency = 32
+        self._poll_concurrency = max(1, concurrency)
+        self._poll_interval = number("POLL_INTERVAL", positive=True)
+        self._poll_interval_active = number("POLL_INTERVAL_ACTIVE", positive=True)
+        self._poll_interval_idle = number("POLL_INTERVAL_IDLE", positive=True)
+        self._active_window = number("POLL_ACTIVE_WINDOW", positive=True)
+        try:
+            threshold = int(setting("BREAKER_FAILURE_THRESHOLD"))
+        except (TypeError, ValueError):
+            threshold = 3
+        self._breaker_threshold = max(1, threshold)
+        self._breaker_open_seconds = number("BREAKER_OPEN_SECONDS", positive=True)
+        self._breaker_max_open_seconds = number("BREAKER_MAX_OPEN_SECONDS", positive=True)
+        self._breakers = {}
+        self._fetch_metrics = {}
+        # 大于 0 时开启分阶段追踪，耗时超过该值的轮次输出结构化日志
+        self._trace_slow = number("POLL_TRACE_SLOW_SECONDS")
+        self._trace = None
+        self._trace_logger = logging.getLogger("monitor.trace")
+        self._phase_metrics = {phase: POLL_PHASE_SECONDS.labels(phase) for phase in PHASES}
+        self._poll_jitter = min(number("POLL_JITTER"), 0.5)
+        self._servers = {}
+        # 独立进程模式下最近一次写入共享存储的各服务器条目
+        self._shared_entries = {}
+        self._servers_loaded_at = 0.0
+        self._servers_generation = None
+        self._snapshot = None
+        self._snapshot_recheck = number("SERVER_SNAPSHOT_RECHECK", positive=True)
+        self._next_due = {}
+        self._due_heap = []
+        self._states = {}
         self._logger = logging.getLogger("monitor")
+        # 分片运行时玩家状态随租约行保存，多个进程共用一个快照文件会互相覆盖，不再写文件
+        self._state_path = (setting("STATE_SNAPSHOT_PATH") or None) if leases is None else None
+        self._state_interval = number("STATE_SNAPSHOT_INTERVAL", positive=True)
+        self._state_max_age = number("STATE_SNAPSHOT_MAX_AGE", positive=True)
+        self._state_saved_at = 0.0
+        self._state_lock = threading.Lock()
+        self._restore_states()
         self._bluemap_settings = {}
         self._bluemap_debug = BLUEMAP_DEBUG
         self._bluemap_world_hits = {}
@@ -54,172 +150,602 @@ class ServerMonitor:
         self._thread = threading.Thread(target=self._loop, daemon=True)
         self._thread.start()
 
+    @property
+    def thread_ident(self):
+        thread = self._thread
+        return thread.ident if thread is not None and thread.is_alive() else None
+
     def stop(self):
         self._stop.set()
+        # 等当前一轮轮询结束再保存，避免与监控线程同时修改状态
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=_STOP_JOIN_SECONDS)
+            if thread.is_alive():
+                self._logger.warning("Monitor thread still running after %ss", _STOP_JOIN_SECONDS)
+        self._checkpoint_states()
+        if self._leases is not None:
+            try:
+                self._leases.release_all(
+                    {sid: state.to_record() for sid, state in self._states.items() if sid in self._owned}
+                )
+            except Exception:
+                self._logger.exception("Failed to release leases")
         with self._bluemap_capture_lock:
             self._close_bluemap_runtime()
 
     def reset_players(self, server_id: int | None = None):
         if server_id is None:
-            target_ids = list(self._last_players.keys())
+            target_ids = list(self._states.keys())
         else:
             target_ids = [server_id]
         for sid in target_ids:
-            self._last_players[sid] = set()
-            self._player_seen_at[sid] = {}
-            if self._last_counts.get(sid) is None:
-                self._last_counts[sid] = 0
+            state = self._state_for(sid)
+            state.clear_players()
+            if state.last_count is None:
+                state.last_count = 0
 
-    def _loop(self):
-        while not self._stop.is_set():
-            self._poll_once()
-            self._maybe_close_bluemap_runtime_if_idle()
-            time.sleep(POLL_INTERVAL)
+    def _state_for(self, server_id: int) -> ServerState:
+        state = self._states.get(server_id)
+        if state is None:
+            state = ServerState()
+            self._states[server_id] = state
+        return state
 
-    def _poll_once(self):
+    # 启动时恢复上次退出前的玩家与在线状态，避免重启后重新计时和误发上下线提醒
+    def _restore_states(self):
+        if not self._state_path:
+            return
+        try:
+            states = load_states(self._state_path, self._state_max_age, time.time())
+        except Exception:
+            self._logger.exception("Failed to load monitor state from %s", self._state_path)
+            return
+        if states:
+            self._states.update(states)
+            self._logger.info("Restored monitor state for %d servers", len(states))
+
+    def _checkpoint_states(self):
+        if not self._state_path:
+            return
         now = time.time()
+        with self._state_lock:
+            try:
+                save_states(self._state_path, dict(self._states), now)
+            except Exception:
+                self._logger.exception("Failed to save monitor state to %s", self._state_path)
+                return
+            self._state_saved_at = now
+
+    def _maybe_checkpoint_states(self):
+        if time.time() - self._state_saved_at >= self._state_interval:
+            self._checkpoint_states()
+
+    def _loop(self):
+        self._event_loop = asyncio.new_event_loop()
+        try:
+            while not self._stop.is_set():
+                self._poll_once()
+                self._maybe_checkpoint_states()
+                self._maybe_close_bluemap_runtime_if_idle()
+                self._stop.wait(self._seconds_until_next_poll())
+        finally:
+            # 被丢弃的 Query 任务可能还没处理完取消，关闭循环前收尾
+            pending = asyncio.all_tasks(self._event_loop)
+            for task in pending:
+                task.cancel()
+            if pending:
+                self._event_loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            close_query_sessions(self._event_loop)
+            self._event_loop.close()
+            self._event_loop = None
+
+    async def _fetch_all(self, servers: list, now: float) -> list:
+        semaphore = asyncio.Semaphore(self._poll_concurrency)
+
+        async def _probe(server: dict) -> dict | None:
+            breaker = self._breaker_for(server)
+            if not breaker.allow(now):
+                return None
+            timeouts = (server.get("connect_timeout"), server.get("read_timeout"))
+            # 半开试探只发 Ping，不带 Query
+            use_query = USE_QUERY_FOR_PLAYERS and breaker.state != HALF_OPEN
+            async with semaphore:
+                trace = self._trace
+                dns = None
+                if trace is not None:
+                    # gather 为每个探测建立独立任务，这里的设置不影响其他服务器
+                    dns = [0.0]
+                    resolve_timing.set(dns)
+                started = time.perf_counter()
+                status = None
+                try:
+                    status = await async_fetch_status(
+                        server["host"], server["port"], use_query, QUERY_PORT, *timeouts
+                    )
+                    return status
+                finally:
+                    elapsed = time.perf_counter() - started
+                    self._fetch_metric(server["id"]).observe(elapsed)
+                    if trace is not None:
+                        trace.probes.append(
+                            (
+                                server["id"],
+                                f"{server['host']}:{server['port']}",
+                                elapsed,
+                                dns[0],
+                                bool(status and status["online"]),
+                            )
+                        )
+
+        return await asyncio.gather(*(_probe(s) for s in servers))
+
+    def _fetch_metric(self, server_id: int):
+        child = self._fetch_metrics.get(server_id)
+        if child is None:
+            child = FETCH_SECONDS.labels(server_id)
+            self._fetch_metrics[server_id] = child
+        return child
+
+    def _breaker_for(self, server: dict) -> CircuitBreaker:
+        key = (server["host"].strip().lower(), server["port"])
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                self._breaker_threshold,
+                self._breaker_open_seconds,
+                self._breaker_max_open_seconds,
+            )
+            self._breakers[key] = breaker
+        return breaker
+
+    # 独立进程模式下从共享存储读取 Web 进程发来的通知；首次读取只记录基线
+    def _apply_signals(self):
+        if self._status_store is None:
+            return
+        try:
+            signals = self._status_store.signals()
+        except Exception:
+            self._logger.exception("Failed to read monitor signals")
+            return
+        previous = self._signals
+        self._signals = signals
+        if previous is None:
+            return
+        for name, value in signals.items():
+            if value == previous.get(name) or not name.startswith("reset:"):
+                continue
+            if name == RESET_ALL_SIGNAL:
+                self.reset_players()
+            else:
+                try:
+                    server_id = int(name.split(":", 1)[1])
+                except ValueError:
+                    continue
+                # 分片时只处理本进程负责的服务器
+                if server_id in self._servers:
+                    self.reset_players(server_id)
+
+    def _refresh_servers(self, now: float):
+        if self._status_store is not None:
+            generation = (self._signals or {}).get(SERVERS_SIGNAL, 0)
+        else:
+            generation = current_generation()
+        changed = generation != self._servers_generation
+        if not changed and now - self._servers_loaded_at < self._snapshot_recheck:
+            return
         with self.app.app_context():
-            servers = Server.query.filter_by(enabled=True).all()
-            servers = [
-                {
-                    "id": s.id,
-                    "name": s.name,
-                    "host": s.host,
-                    "port": s.port,
-                    "bindings": [
-                        {
-                            "id": b.id,
-                            "name": b.name,
-                            "onebot_ws_url": b.onebot_ws_url,
-                            "onebot_access_token": b.onebot_access_token,
-                            "onebot_target_type": b.onebot_target_type,
-                            "onebot_target_id": b.onebot_target_id,
-                            "enable_onebot": b.enable_onebot,
-                            "notify_player_changes": b.notify_player_changes,
-                            "notify_server_status": b.notify_server_status,
-                            "bluemap_url": b.bluemap_url,
-                            "enable_bluemap": b.enable_bluemap,
-                            "send_screenshot": b.send_screenshot,
-                        }
-                        for b in s.bindings
-                    ],
-                }
-                for s in servers
-            ]
-
-        for s in servers:
-            offline_since = self._offline_since.get(s["id"])
-            last_polled = self._last_polled.get(s["id"], 0)
-            if offline_since and now - offline_since >= 1800 and now - last_polled < 60:
+            snapshot = load_enabled_servers()
+        self._servers_loaded_at = now
+        self._servers_generation = generation
+        # 定期复核：没有后台改动通知时快照一般不变，直接沿用
+        if snapshot == self._snapshot:
+            return
+        self._forget_edited_hosts(self._snapshot or (), snapshot)
+        self._close_removed_sessions(self._snapshot, snapshot, now)
+        self._snapshot = snapshot
+        self._set_servers(now)
+
+    # 后台编辑过的服务器丢弃其新旧地址的解析、Query 缓存与熔断状态；
+    # 独立进程模式下 Web 进程只能清到自己的缓存，由这里在监控进程中补上
+    def _forget_edited_hosts(self, previous: tuple, snapshot: tuple):
+        old = {s["id"]: s for s in previous}
+        for server in snapshot:
+            before = old.get(server["id"])
+            if before is None or all(
+                before[k] == server[k] for k in server if k != "bindings"
+            ):
                 continue
+            self._breakers.pop((before["host"].strip().lower(), before["port"]), None)
+            flush_resolve_cache(before["host"])
+            flush_resolve_cache(server["host"])
 
-            status = fetch_status(s["host"], s["port"], USE_QUERY_FOR_PLAYERS, QUERY_PORT)
-            self._last_polled[s["id"]] = now
-            status["checked_at"] = datetime.utcnow().isoformat() + "Z"
-            current_count = status.get("players_online") or 0
-            max_count = status.get("players_max") or 0
-            last_count = self._last_counts.get(s["id"])
-            last_players = self._last_players.get(s["id"]) or set()
-            last_online = self._last_online.get(s["id"])
-
-            if not status["online"]:
-                status["players_display"] = []
-                if last_online is True:
-                    for binding in self._iter_bindings(s):
-                        if self._notify_server_status(binding):
-                            self.onebot.send_text(
-                                self._settings_for_binding(binding),
-                                f"[{s['name']}] 服务器离线",
-                            )
-                if last_online is not False:
-                    self._offline_since[s["id"]] = now
-                else:
-                    self._offline_since.setdefault(s["id"], now)
-                update_status(s["id"], status)
-                self._last_counts[s["id"]] = None
-                self._last_players[s["id"]] = set()
-                self._player_seen_at[s["id"]] = {}
-                self._last_online[s["id"]] = False
+    # 被删除或停用的服务器不会再探测到离线，结束其未关闭的玩家会话；
+    # 分片时每个进程都会执行，关闭会话的更新可重复
+    def _close_removed_sessions(self, previous, snapshot: tuple, now: float):
+        if self.history is None or previous is None:
+            return
+        remaining = {s["id"] for s in snapshot}
+        for server in previous:
+            if server["id"] not in remaining:
+                self.history.close_all(server["id"], now)
+
+    # 按当前快照（分片时只取本进程持有租约的服务器）更新调度与各类按服务器缓存
+    def _set_servers(self, now: float):
+        if self._snapshot is None:
+            return
+        servers = {
+            s["id"]: s
+            for s in self._snapshot
+            if self._leases is None or s["id"] in self._owned
+        }
+        for sid, server in servers.items():
+            if sid not in self._next_due:
+                # 新服务器在一个间隔内随机错开首次探测，避免同时发包
+                self._schedule(sid, now + random.uniform(0, self._interval_for(server, now)))
+        for sid in list(self._next_due):
+            if sid not in servers:
+                self._next_due.pop(sid, None)
+        for sid in list(self._states):
+            if sid not in servers:
+                self._states.pop(sid, None)
+        hosts = {(s["host"].strip().lower(), s["port"]) for s in servers.values()}
+        for key in list(self._breakers):
+            if key not in hosts:
+                self._breakers.pop(key, None)
+        for sid in list(self._fetch_metrics):
+            if sid not in servers:
+                # 删除或移交给其他进程的服务器不再导出
+                self._fetch_metrics.pop(sid, None)
+                FETCH_SECONDS.remove(sid)
+        if self._status_store is not None:
+            # 删除或移交出去的服务器丢弃本进程的旧状态，重新接手时不会用它覆盖其他进程写入的结果
+            dropped = [sid for sid in self._servers if sid not in servers]
+            if dropped:
+                commit_status(dropped)
+            for sid in dropped:
+                self._shared_entries.pop(sid, None)
+        self._servers = servers
+        self._publish_payload()
+
+    def _schedule(self, server_id: int, due: float):
+        self._next_due[server_id] = due
+        heapq.heappush(self._due_heap, (due, server_id))
+
+    def _pop_due(self, now: float) -> list:
+        due = []
+        while self._due_heap and self._due_heap[0][0] <= now:
+            when, sid = heapq.heappop(self._due_heap)
+            if self._next_due.get(sid) != when:
+                continue
+            server = self._servers.get(sid)
+            if server is not None:
+                due.append(server)
+        return due
+
+    def _seconds_until_next_poll(self) -> float:
+        now = time.time()
+        # 至少每秒醒来一次检查快照代数，后台新增的服务器能及时开始轮询
+        wake_at = now + 1.0
+        while self._due_heap:
+            when, sid = self._due_heap[0]
+            if self._next_due.get(sid) == when:
+                wake_at = min(wake_at, when)
+                break
+            heapq.heappop(self._due_heap)
+        return max(0.0, wake_at - now)
+
+    def _interval_for(self, server: dict, now: float) -> float:
+        state = self._state_for(server["id"])
+        base = server.get("poll_interval") or self._poll_interval
+        if state.last_online is False:
+            return base
+        if now - state.last_change_at < self._active_window:
+            return min(base, self._poll_interval_active)
+        if state.last_online and not state.last_count:
+            return max(base, self._poll_interval_idle)
+        return base
+
+    # 分片模式：按租约周期的 1/3 心跳续租，接手的服务器恢复前任保存的状态
+    def _renew_leases(self, now: float):
+        if self._leases is None or now < self._lease_renew_at:
+            return
+        self._lease_renew_at = now + self._leases.lease_seconds / 3
+        states = {sid: state.to_record() for sid, state in self._states.items() if sid in self._owned}
+        try:
+            owned, claimed = self._leases.heartbeat(now, states, self._owned)
+        except Exception:
+            self._logger.exception("Lease heartbeat failed")
+            return
+        self._lease_expires = now + self._leases.lease_seconds
+        for sid, record in claimed.items():
+            if record is not None:
+                self._states[sid] = ServerState.from_record(record)
+        if owned != self._owned:
+            self._logger.info(
+                "Leases changed: holding %d servers (+%d, -%d)",
+                len(owned),
+                len(owned - self._owned),
+                len(self._owned - owned),
+            )
+            self._owned = owned
+            self._set_servers(now)
+
+    def _poll_once(self):
+        now = time.time()
+        if self._trace_slow <= 0:
+            self._poll_cycle(now)
+            return
+        trace = CycleTrace(now)
+        self._trace = trace
+        try:
+            self._poll_cycle(now)
+        finally:
+            self._trace = None
+            self._finish_trace(trace)
+
+    # 追踪未开启时 _trace 为 None，各阶段切换只是一次属性判断
+    def _phase(self, phase):
+        trace = self._trace
+        if trace is None:
+            return None
+        return trace.switch(phase)
+
+    def _finish_trace(self, trace: CycleTrace):
+        total = trace.finish()
+        if trace.probes:
+            for phase, seconds in trace.durations.items():
+                self._phase_metrics[phase].observe(seconds)
+        if total >= self._trace_slow:
+            self._trace_logger.warning(
+                "Slow poll cycle %s",
+                json.dumps(trace.record(total), ensure_ascii=False, separators=(",", ":")),
+            )
+
+    def _poll_cycle(self, now: float):
+        self._phase(SNAPSHOT)
+        self._apply_signals()
+        self._renew_leases(now)
+        self._refresh_servers(now)
+        if self._leases is not None and now >= self._lease_expires:
+            # 续租失败时租约可能已被其他进程接手，暂停探测以免重复推送
+            return
+
+        due = self._pop_due(now)
+        if not due:
+            return
+        self._phase(PROBE)
+        statuses = self._event_loop.run_until_complete(self._fetch_all(due, now))
+        self._phase(DIFF)
+        shortest = None
+        skipped = []
+        handled = []
+        for s, status in zip(due, statuses):
+            breaker = self._breaker_for(s)
+            if status is None:
+                skipped.append(s)
+                continue
+            trial = breaker.state == HALF_OPEN
+            if status["online"]:
+                breaker.record_success()
+                if trial and USE_QUERY_FOR_PLAYERS:
+                    # 试探没有 Query，玩家列表可能不全；下一轮做完整探测后再更新状态，避免误报上下线
+                    self._schedule(s["id"], now)
+                    continue
+            else:
+                breaker.record_failure(now)
+            handled.append(s["id"])
+            status["breaker"] = breaker.snapshot()
+            self._handle_status(s, status, now)
+            if breaker.state == OPEN:
+                self._schedule(s["id"], breaker.retry_at)
                 continue
+            interval = self._interval_for(s, now)
+            if shortest is None or interval < shortest:
+                shortest = interval
+            jitter = interval * self._poll_jitter
+            self._schedule(s["id"], now + interval + random.uniform(-jitter, jitter))
+        # 被熔断跳过的服务器等本轮半开试探有了结果再排期：恢复则下一轮探测，仍失败则等新的冷却期
+        for s in skipped:
+            self._schedule(s["id"], self._breaker_for(s).retry_at)
+        self._phase(PUBLISH)
+        self._publish_payload(handled)
+        elapsed = time.time() - now
+        POLL_CYCLE_SECONDS.observe(elapsed)
+        # 一轮耗时超过最短探测间隔时，下一次探测已经晚了
+        if shortest is not None and elapsed > shortest:
+            POLL_CYCLE_OVERRUNS.inc()
 
-            if last_online is False:
+    # 每轮只序列化一次 /api/servers 响应体，接口直接返回这份 bytes；
+    # 独立进程模式下只把本轮探测过的服务器写入共享存储。服务器列表变化时只重写本进程已有状态、
+    # 且名称或地址变了的条目：刚接手还没探测的服务器保留前任写入的状态行，不会被空白的离线条目覆盖
+    def _publish_payload(self, changed_ids=None):
+        statuses = commit_status().statuses
+        if self._status_store is not None:
+            ids = self._servers if changed_ids is None else changed_ids
+            entries = []
+            for sid in ids:
+                server = self._servers.get(sid)
+                if server is None or sid not in statuses:
+                    continue
+                entry = self._entry_for(server, statuses)
+                if changed_ids is None and self._shared_entries.get(sid) == entry:
+                    continue
+                entries.append(entry)
+            try:
+                self._status_store.publish_entries(entries)
+            except Exception:
+                self._logger.exception("Failed to publish status to shared store")
+                return
+            for entry in entries:
+                self._shared_entries[entry["id"]] = entry
+            return
+        publish_payload([self._entry_for(s, statuses) for s in reversed(self._servers.values())])
+
+    @staticmethod
+    def _entry_for(server: dict, statuses) -> dict:
+        return server_entry(
+            server["id"], server["name"], f"{server['host']}:{server['port']}", statuses.get(server["id"])
+        )
+
+    def _handle_status(self, s: dict, status: dict, now: float):
+        status["checked_at"] = datetime.utcnow().isoformat() + "Z"
+        current_count = status.get("players_online") or 0
+        max_count = status.get("players_max") or 0
+        state = self._state_for(s["id"])
+        last_count = state.last_count
+        last_players = state.players
+        last_online = state.last_online
+
+        if not status["online"]:
+            status["players_display"] = []
+            if last_online is True:
+                previous = self._phase(NOTIFY)
                 for binding in self._iter_bindings(s):
                     if self._notify_server_status(binding):
                         self.onebot.send_text(
                             self._settings_for_binding(binding),
-                            f"[{s['name']}] 服务器已上线",
+                            f"[{s['name']}] 服务器离线",
                         )
-            self._offline_since.pop(s["id"], None)
-            self._last_online[s["id"]] = True
+                self._phase(previous)
+            if last_online is not False or state.offline_since is None:
+                state.offline_since = now
+            if self.history is not None:
+                self.history.record_sample(s["id"], now, False, 0, None)
+                if last_online is not False:
+                    self.history.close_all(s["id"], now)
+            previous = self._phase(UPDATE_STATUS)
+            update_status(s["id"], status)
+            self._phase(previous)
+            state.last_count = None
+            state.clear_players()
+            state.last_online = False
+            return
 
-            players_list = status.get("players") or []
-            players_list = [name for name in players_list if name and name != "Anonymous Player"]
-            current_players = set(players_list)
+        if last_online is False:
+            previous = self._phase(NOTIFY)
+            for binding in self._iter_bindings(s):
+                if self._notify_server_status(binding):
+                    self.onebot.send_text(
+                        self._settings_for_binding(binding),
+                        f"[{s['name']}] 服务器已上线",
+                    )
+            self._phase(previous)
+        state.offline_since = None
+        state.last_online = True
 
-            seen_at = self._player_seen_at.get(s["id"], {})
+        players_list = status.get("players") or []
+        players_list = [
+            intern_name(name) for name in players_list if name and name != "Anonymous Player"
+        ]
+        current_players = frozenset(players_list)
+        if last_online is False or (last_count is not None and current_count != last_count):
+            state.last_change_at = now
+        if self.history is not None:
+            self._record_history(s["id"], status, current_players, last_players, last_online, now)
 
-            if current_count == 0 and last_players:
-                durations = {name: now - seen_at.get(name, now) for name in last_players}
-                for binding in self._iter_bindings(s):
-                    if self._notify_player_changes(binding):
-                        self.onebot.send_player_change(
-                            self._settings_for_binding(binding),
-                            s["name"],
-                            [],
-                            sorted(last_players),
-                            current_count,
-                            max_count,
-                            durations,
-                        )
-                last_players = set()
-                seen_at = {}
+        # 玩家集合不变时直接沿用已存的上线时间，只有变化时才展开成 dict 修改
+        seen_at = None
+
+        if current_count == 0 and last_players:
+            durations = {name: now - state.seen_at(name, now) for name in last_players}
+            previous = self._phase(NOTIFY)
+            for binding in self._iter_bindings(s):
+                if self._notify_player_changes(binding):
+                    self.onebot.send_player_change(
+                        self._settings_for_binding(binding),
+                        s["name"],
+                        [],
+                        sorted(last_players),
+                        current_count,
+                        max_count,
+                        durations,
+                    )
+            self._phase(previous)
+            last_players = frozenset()
+            seen_at = {}
 
-            if current_players:
+        if current_players:
+            if seen_at is None and current_players != last_players:
+                seen_at = state.seen_dict()
+            if seen_at is not None:
                 for name in current_players:
                     if name not in seen_at:
                         seen_at[name] = now
 
-                if last_count is not None and current_players != last_players:
-                    joined = sorted(current_players - last_players)
-                    left = sorted(last_players - current_players)
-                    if joined or left:
-                        durations = {name: now - seen_at.get(name, now) for name in left}
-                        for binding in self._iter_bindings(s):
-                            if self._notify_player_changes(binding):
-                                self.onebot.send_player_change(
-                                    self._settings_for_binding(binding),
-                                    s["name"],
-                                    joined,
-                                    left,
-                                    current_count,
-                                    max_count,
-                                    durations,
-                                )
-                            if self._send_bluemap_screenshot(binding):
-                                for name in joined:
-                                    self._schedule_bluemap_lookup(s, binding, name)
-                    for name in left:
-                        seen_at.pop(name, None)
-                last_players = current_players
-
-            display_players = players_list if players_list else sorted(last_players)
-            status["players_display"] = [
-                f"{name}:{format_duration(now - seen_at.get(name, now))}"
-                for name in display_players
-            ]
-
-            if last_count is not None and current_count == 0 and last_count > 0:
-                for binding in self._iter_bindings(s):
-                    if self._notify_player_changes(binding):
-                        self.onebot.send_text(
-                            self._settings_for_binding(binding),
-                            f"[{s['name']}] 呜呜呜，服务器暂时没人在线哦~",
-                        )
+            if last_count is not None and current_players != last_players:
+                joined = sorted(current_players - last_players)
+                left = sorted(last_players - current_players)
+                if joined or left:
+                    state.last_change_at = now
+                    durations = {name: now - seen_at.get(name, now) for name in left}
+                    previous = self._phase(NOTIFY)
+                    for binding in self._iter_bindings(s):
+                        if self._notify_player_changes(binding):
+                            self.onebot.send_player_change(
+                                self._settings_for_binding(binding),
+                                s["name"],
+                                joined,
+                                left,
+                                current_count,
+                                max_count,
+                                durations,
+                            )
+                        if self._send_bluemap_screenshot(binding):
+                            for name in joined:
+                                self._schedule_bluemap_lookup(s, binding, name)
+                    self._phase(previous)
+                for name in left:
+                    seen_at.pop(name, None)
+            last_players = current_players
 
-            self._last_counts[s["id"]] = current_count
-            self._last_players[s["id"]] = current_players
-            self._player_seen_at[s["id"]] = seen_at
-            update_status(s["id"], status)
+        if seen_at is not None:
+            state.store_seen(seen_at)
+
+        display_players = players_list if players_list else sorted(last_players)
+        status["players_display"] = [
+            f"{name}:{format_duration(now - state.seen_at(name, now))}"
+            for name in display_players
+        ]
+
+        if last_count is not None and current_count == 0 and last_count > 0:
+            previous = self._phase(NOTIFY)
+            for binding in self._iter_bindings(s):
+                if self._notify_player_changes(binding):
+                    self.onebot.send_text(
+                        self._settings_for_binding(binding),
+                        f"[{s['name']}] 呜呜呜，服务器暂时没人在线哦~",
+                    )
+            self._phase(previous)
+
+        state.last_count = current_count
+        state.players = current_players
+        previous = self._phase(UPDATE_STATUS)
+        update_status(s["id"], status)
+        self._phase(previous)
+
+    def _record_history(
+        self,
+        server_id: int,
+        status: dict,
+        current_players: frozenset,
+        last_players: frozenset,
+        last_online,
+        now: float,
+    ):
+        current_count = status.get("players_online") or 0
+        self.history.record_sample(server_id, now, True, current_count, status.get("latency_ms"))
+        if current_count and not current_players:
+            # 人数大于 0 但拿不到名单，无法判断谁上下线
+            return
+        if last_online is None:
+            # 本进程首次探测该服务器，与数据库中遗留的未结束会话对齐
+            self.history.sync_online(server_id, current_players, now)
+            return
+        for name in current_players - last_players:
+            self.history.record_join(server_id, name, now)
+        for name in last_players - current_players:
+            self.history.record_leave(server_id, name, now)
 
     def _settings_for_binding(self, binding: dict) -> dict:
         return {
@@ -405,6 +931,7 @@ class ServerMonitor:
             self._bluemap_browser = browser
             self._bluemap_context = context
             self._bluemap_runtime_last_used = time.time()
+            BLUEMAP_BROWSER_RESTARTS.inc()
             if self._bluemap_debug or self.app.debug:
                 self._logger.info("BlueMap runtime started")
             return True
@@ -458,7 +985,10 @@ class ServerMonitor:
         pos: dict,
     ) -> bytes | None:
         target = self._build_bluemap_link(base_url, world, pos["x"], pos["y"], pos["z"])
+        waited = time.perf_counter()
         with self._bluemap_capture_lock:
+            started = time.perf_counter()
+            BLUEMAP_LOCK_WAIT_SECONDS.observe(started - waited)
             if self._stop.is_set():
                 return None
             if not self._ensure_bluemap_runtime():
@@ -501,6 +1031,7 @@ class ServerMonitor:
 
                 image = page.screenshot(type="png")
                 self._bluemap_runtime_last_used = time.time()
+                BLUEMAP_CAPTURE_SECONDS.observe(time.perf_counter() - started)
                 return image
             except Exception:
                 self._close_bluemap_runtime()
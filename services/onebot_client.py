@@ -2,57 +2,204 @@ import asyncio
 import base64
 import json
 import logging
+import random
 import threading
+import time
 import uuid
+from collections import deque
+from concurrent.futures import Future
 from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 import websockets
 
+from services import metrics
+from services.settings import number, setting
 from services.time_utils import format_duration
+from services.token_bucket import TokenBucket
+
+_LABELS = ("connection",)
+ONEBOT_QUEUE_DEPTH = metrics.gauge("onebot_queue_depth", "Messages waiting to be sent", _LABELS)
+ONEBOT_SENDS = metrics.counter("onebot_sends_total", "Messages written to the WebSocket", _LABELS)
+ONEBOT_SEND_FAILURES = metrics.counter(
+    "onebot_send_failures_total", "WebSocket writes that raised", _LABELS
+)
+ONEBOT_RECONNECTS = metrics.counter(
+    "onebot_reconnects_total", "WebSocket reconnect attempts after the first connection", _LABELS
+)
+ONEBOT_COALESCED = metrics.counter(
+    "onebot_coalesced_total", "Messages merged into an earlier queued message", _LABELS
+)
+ONEBOT_DROPPED = metrics.counter(
+    "onebot_dropped_total",
+    "Messages dropped because a target queue was full, OneBot rejected them or retries ran out",
+    _LABELS,
+)
+ONEBOT_RETRIES = metrics.counter(
+    "onebot_retries_total", "Messages re-queued after a failed or unacknowledged send", _LABELS
+)
+
+
+_coalesce_seconds = number("ONEBOT_COALESCE_SECONDS")
+_target_rate = number("ONEBOT_TARGET_RATE_PER_MINUTE")
+_target_burst = int(number("ONEBOT_TARGET_BURST"))
+_connection_rate = number("ONEBOT_CONNECTION_RATE_PER_MINUTE")
+_connection_burst = int(number("ONEBOT_CONNECTION_BURST"))
+_target_queue_limit = max(1, int(number("ONEBOT_TARGET_QUEUE_LIMIT")))
+_overflow_coalesce = str(setting("ONEBOT_OVERFLOW_POLICY")).strip().lower() == "coalesce"
+_ack_timeout = number("ONEBOT_ACK_TIMEOUT", positive=True)
+_retry_base = number("ONEBOT_RETRY_BASE_SECONDS", positive=True)
+_retry_max = max(_retry_base, number("ONEBOT_RETRY_MAX_SECONDS"))
+_max_attempts = int(number("ONEBOT_MAX_ATTEMPTS"))
+# 合并后单条消息的长度上限，超过则另起一条
+_MAX_MERGED_CHARS = 3000
+# 事件循环来不及取走时入口缓冲的上限，超出的新消息直接失败
+_INTAKE_LIMIT = 10000
+
+
+def _failed(reason: str) -> dict:
+    return {"status": "failed", "retcode": -1, "message": reason}
+
+
+# 发送接口立即返回的句柄：结果为 OneBot 的回执，或丢弃、放弃重试时的失败结果；
+# 线程中用 result(timeout) 等待，协程中可直接 await
+class SendHandle(Future):
+    def __await__(self):
+        return asyncio.wrap_future(self).__await__()
+
+
+# key 同时用作 echo，收到成功回执才算送达；interactive 为等待结果的即时消息，不持久化也不重试；
+# handles 为合并进这条消息的各次发送的句柄；omitted 为队列已满时被省略、只在末尾计数的消息数，
+# summary_at 为计数行在 message 中的起始位置
+class _Outgoing:
+    __slots__ = (
+        "key",
+        "message",
+        "interactive",
+        "handles",
+        "ready_at",
+        "attempts",
+        "created_at",
+        "omitted",
+        "summary_at",
+    )
+
+    def __init__(
+        self,
+        key: str,
+        message,
+        interactive: bool,
+        handles: list,
+        ready_at: float,
+        attempts: int,
+        created_at: float,
+    ):
+        self.key = key
+        self.message = message
+        self.interactive = interactive
+        self.handles = handles
+        self.ready_at = ready_at
+        self.attempts = attempts
+        self.created_at = created_at
+        self.omitted = 0
+        self.summary_at = 0
+
+    @property
+    def mergeable(self) -> bool:
+        return not self.interactive and isinstance(self.message, str)
+
+
+# 每个目标（群/私聊）一个待发队列和一个令牌桶；同一目标同时只有一条消息等待回执，保证顺序
+class _TargetOutbox:
+    __slots__ = ("target_type", "target_id", "messages", "bucket", "inflight")
+
+    def __init__(self, target_type: str, target_id: int):
+        self.target_type = target_type
+        self.target_id = target_id
+        self.messages = deque()
+        self.bucket = TokenBucket(_target_rate, _target_burst)
+        self.inflight = None
 
 
+def _succeeded(response: dict) -> bool:
+    return response.get("status") in ("ok", "async") or response.get("retcode") in (0, 1)
+
+
+# 一个 OneBot 端点（ws_url + access_token）一条连接，发往不同群/私聊的消息共用；
+# 连接以任务形式运行在 OneBotManager 共享的事件循环上，不再各自占用线程
 class OneBotClient:
-    def __init__(self, ws_url: str, access_token: str, target_type: str, target_id: str):
+    def __init__(self, ws_url: str, access_token: str, loop, store=None):
         self.ws_url = ws_url
         self.access_token = access_token
-        self.target_type = target_type
-        self.target_id = target_id
 
-        self._loop = None
-        self._thread = None
-        self._queue = None
-        self._queue_ready = threading.Event()
+        self._loop = loop
+        self._store = store
+        self._task = None
+        self._started = False
+        # (目标类型, 目标号) -> _TargetOutbox，只在事件循环线程中访问
+        self._outboxes = {}
+        self._queued = 0
+        self._wakeup = None
+        self._connection_bucket = TokenBucket(_connection_rate, _connection_burst)
+        # 发送方线程只往这里追加，事件循环批量取走；客户端创建时即存在，循环未就绪也不会阻塞
+        self._intake = deque()
+        self._drain_scheduled = False
+        self._ready = False
         self._stop = threading.Event()
+        # echo -> (_TargetOutbox, _Outgoing, 回执截止时间)
         self._pending = {}
         self._logger = logging.getLogger("onebot")
+        # 标签只用去掉查询串的地址，不导出 access_token
+        labels = (urlunsplit(urlsplit(ws_url)[:3] + ("", "")),)
+        self._metric_sends = ONEBOT_SENDS.labels(*labels)
+        self._metric_failures = ONEBOT_SEND_FAILURES.labels(*labels)
+        self._metric_reconnects = ONEBOT_RECONNECTS.labels(*labels)
+        self._metric_coalesced = ONEBOT_COALESCED.labels(*labels)
+        self._metric_dropped = ONEBOT_DROPPED.labels(*labels)
+        self._metric_retries = ONEBOT_RETRIES.labels(*labels)
+        ONEBOT_QUEUE_DEPTH.labels(*labels).set_function(self._queue_depth)
+
+    def _queue_depth(self) -> int:
+        return self._queued
 
     def start(self):
-        if not self.ws_url:
-            return
-        if self._thread and self._thread.is_alive():
+        if not self.ws_url or self._started:
             return
-        self._thread = threading.Thread(target=self._run, daemon=True)
-        self._thread.start()
+        self._started = True
+        self._loop.call_soon_threadsafe(self._start_task)
 
     def stop(self):
         self._stop.set()
-        if self._loop:
-            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
 
-    def _run(self):
-        self._loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self._loop)
-        self._queue = asyncio.Queue()
-        self._queue_ready.set()
-        self._loop.create_task(self._runner())
-        self._loop.run_forever()
+    async def aclose(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._fail_pending("closed")
+
+    # 可从任意线程调用，rows 为 OneBotOutbox 接手的消息
+    def restore(self, rows: list):
+        self._loop.call_soon_threadsafe(self._restore, rows)
+
+    # 在共享循环线程中执行
+    def _start_task(self):
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._runner())
+        self._ready = True
+        self._drain_intake()
 
     async def _runner(self):
         headers = {}
         if self.access_token:
             headers["Authorization"] = f"Bearer {self.access_token}"
 
+        connected_before = False
         while not self._stop.is_set():
+            if connected_before:
+                self._metric_reconnects.inc()
+            connected_before = True
             try:
                 ws_url = self._build_ws_url()
                 self._logger.info("OneBot WS connecting: %s", ws_url)
@@ -67,60 +214,237 @@ class OneBotClient:
                             additional_headers=headers,
                             **connect_kwargs,
                         ) as ws:
-                            self._logger.info("OneBot WS connected: %s", ws_url)
-                            send_task = asyncio.create_task(self._send_loop(ws))
-                            recv_task = asyncio.create_task(self._recv_loop(ws))
-                            done, pending = await asyncio.wait(
-                                [send_task, recv_task],
-                                return_when=asyncio.FIRST_COMPLETED,
-                            )
-                            for task in pending:
-                                task.cancel()
-                            await asyncio.gather(*pending, return_exceptions=True)
+                            await self._serve(ws, ws_url)
                     except TypeError:
                         async with websockets.connect(
                             ws_url,
                             extra_headers=headers,
                             **connect_kwargs,
                         ) as ws:
-                            self._logger.info("OneBot WS connected: %s", ws_url)
-                            send_task = asyncio.create_task(self._send_loop(ws))
-                            recv_task = asyncio.create_task(self._recv_loop(ws))
-                            done, pending = await asyncio.wait(
-                                [send_task, recv_task],
-                                return_when=asyncio.FIRST_COMPLETED,
-                            )
-                            for task in pending:
-                                task.cancel()
-                            await asyncio.gather(*pending, return_exceptions=True)
+                            await self._serve(ws, ws_url)
                 else:
                     async with websockets.connect(ws_url, **connect_kwargs) as ws:
-                        self._logger.info("OneBot WS connected: %s", ws_url)
-                        send_task = asyncio.create_task(self._send_loop(ws))
-                        recv_task = asyncio.create_task(self._recv_loop(ws))
-                        done, pending = await asyncio.wait(
-                            [send_task, recv_task],
-                            return_when=asyncio.FIRST_COMPLETED,
-                        )
-                        for task in pending:
-                            task.cancel()
-                        await asyncio.gather(*pending, return_exceptions=True)
+                        await self._serve(ws, ws_url)
                 self._fail_pending("disconnected")
             except Exception:
                 self._logger.exception("OneBot WS connection error")
                 self._fail_pending("disconnected")
                 await asyncio.sleep(5)
 
+    async def _serve(self, ws, ws_url: str):
+        self._logger.info("OneBot WS connected: %s", ws_url)
+        tasks = [
+            asyncio.create_task(self._send_loop(ws)),
+            asyncio.create_task(self._recv_loop(ws)),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # 任一方结束或连接任务被取消时，另一方也一并结束
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _outbox_for(self, target_type: str, target_id: int) -> _TargetOutbox:
+        key = (target_type, target_id)
+        outbox = self._outboxes.get(key)
+        if outbox is None:
+            outbox = self._outboxes[key] = _TargetOutbox(target_type, target_id)
+        return outbox
+
+    # 在事件循环线程中入队：同一目标排队中的纯文本消息直接合并（单条不超过 _MAX_MERGED_CHARS），
+    # 新消息等待合并窗口后才可发送；队列满时按 ONEBOT_OVERFLOW_POLICY 丢弃最旧的一条，
+    # 或（coalesce）在最后一条末尾只记被省略的条数，最后一条不是文字时仍丢弃最旧的一条
+    def _enqueue(self, target_type: str, target_id: int, message, interactive: bool, handle):
+        outbox = self._outbox_for(target_type, target_id)
+        messages = outbox.messages
+        mergeable = not interactive and isinstance(message, str)
+        if mergeable and messages and messages[-1].mergeable:
+            last = messages[-1]
+            if not last.omitted and len(last.message) + len(message) < _MAX_MERGED_CHARS:
+                last.message += "\n" + message
+                last.handles.append(handle)
+                self._metric_coalesced.inc()
+                self._persist(outbox, last)
+                return
+            if _overflow_coalesce and len(messages) >= _target_queue_limit:
+                self._omit(outbox, last, handle)
+                return
+        self._make_room(outbox)
+        now = time.monotonic()
+        entry = _Outgoing(
+            uuid.uuid4().hex,
+            message,
+            interactive,
+            [handle],
+            now + _coalesce_seconds if mergeable else now,
+            0,
+            time.time(),
+        )
+        messages.append(entry)
+        self._queued += 1
+        self._persist(outbox, entry)
+        self._wakeup.set()
+
+    # 内容不再保留，长度与内存都不随省略的条数增长；该次发送的句柄直接以 dropped 结束
+    def _omit(self, outbox: _TargetOutbox, entry: _Outgoing, handle):
+        if not entry.omitted:
+            entry.summary_at = len(entry.message)
+        entry.omitted += 1
+        entry.message = entry.message[: entry.summary_at] + f"\n……另有 {entry.omitted} 条消息因队列已满省略"
+        self._metric_dropped.inc()
+        handle.set_result(_failed("dropped"))
+        self._persist(outbox, entry)
+
+    def _make_room(self, outbox: _TargetOutbox):
+        while len(outbox.messages) >= _target_queue_limit:
+            dropped = outbox.messages.popleft()
+            self._queued -= 1
+            self._metric_dropped.inc()
+            self._discard(dropped, "dropped")
+
+    # 接手数据库中未送达的消息（重启前或失联进程留下的），已在库中无需再写
+    def _restore(self, rows: list):
+        now = time.monotonic()
+        for row in rows:
+            outbox = self._outbox_for(row["target_type"], row["target_id"])
+            self._make_room(outbox)
+            outbox.messages.append(
+                _Outgoing(row["key"], row["message"], False, [], now, row["attempts"], row["created_at"])
+            )
+            self._queued += 1
+        self._wakeup.set()
+
+    def _persist(self, outbox: _TargetOutbox, entry: _Outgoing):
+        if self._store is None or entry.interactive:
+            return
+        self._store.save(
+            entry.key,
+            self.ws_url,
+            self.access_token,
+            outbox.target_type,
+            outbox.target_id,
+            entry.message,
+            entry.attempts,
+            entry.created_at,
+        )
+
+    # 消息生命周期结束（送达、丢弃或放弃重试）
+    def _discard(self, entry: _Outgoing, reason: str, response: dict | None = None):
+        result = response or _failed(reason)
+        for handle in entry.handles:
+            if not handle.done():
+                handle.set_result(result)
+        if self._store is not None and not entry.interactive:
+            self._store.delete(entry.key)
+
+    # 轮流检查各目标，取出第一条已过合并窗口且目标与连接都有令牌的消息；
+    # 没有可发的消息时返回还需等待的秒数（None 表示队列为空）
+    def _take_ready(self, now: float):
+        soonest = self._connection_bucket.wait_time(now)
+        if soonest:
+            return None, None, soonest
+        soonest = None
+        for key, outbox in self._outboxes.items():
+            if not outbox.messages or outbox.inflight is not None:
+                continue
+            wait = max(outbox.messages[0].ready_at - now, outbox.bucket.wait_time(now))
+            if wait <= 0:
+                entry = outbox.messages.popleft()
+                self._queued -= 1
+                outbox.bucket.take(now)
+                self._connection_bucket.take(now)
+                # 发过的目标移到末尾，避免消息多的目标一直占先
+                del self._outboxes[key]
+                self._outboxes[key] = outbox
+                return outbox, entry, 0.0
+            soonest = wait if soonest is None else min(soonest, wait)
+        return None, None, soonest
+
+    # 超时未收到回执的消息重新排队，返回距最近一个回执截止还有多久
+    def _expire_acks(self, now: float):
+        soonest = None
+        for echo, (_, _, deadline) in list(self._pending.items()):
+            if deadline <= now:
+                self._retry(echo, "ack timeout")
+            elif soonest is None or deadline - now < soonest:
+                soonest = deadline - now
+        return soonest
+
     async def _send_loop(self, ws):
         while not self._stop.is_set():
-            payload = await self._queue.get()
+            now = time.monotonic()
+            ack_wait = self._expire_acks(now)
+            outbox, entry, wait = self._take_ready(now)
+            if entry is None:
+                if ack_wait is not None:
+                    wait = ack_wait if wait is None else min(wait, ack_wait)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            outbox.inflight = entry
+            self._pending[entry.key] = (outbox, entry, now + _ack_timeout)
+            payload = self._build_payload(outbox.target_type, outbox.target_id, entry.message, entry.key)
             try:
                 await ws.send(json.dumps(payload))
+                self._metric_sends.inc()
                 self._logger.debug("OneBot WS sent: %s", payload.get("action"))
             except Exception:
+                self._metric_failures.inc()
                 self._logger.exception("OneBot WS send failed")
+                self._retry(entry.key, "send failed")
                 break
 
+    # 被拒绝（目标无效、消息过长、机器人被禁言等）重发也不会成功，直接结束，不挡住同一目标后面的消息
+    def _acknowledge(self, echo: str, response: dict):
+        outbox, entry, _ = self._pending.pop(echo)
+        outbox.inflight = None
+        if not entry.interactive and not _succeeded(response):
+            self._logger.warning(
+                "OneBot send rejected target=%s:%s: %s",
+                outbox.target_type,
+                outbox.target_id,
+                response.get("message") or response.get("wording") or response.get("retcode"),
+            )
+            self._metric_dropped.inc()
+        self._discard(entry, "", response)
+        self._wakeup.set()
+
+    # 发送失败或超时未确认（传输层问题）：即时消息直接返回失败，其余按指数退避放回该目标队首重发
+    def _retry(self, echo: str, reason: str):
+        item = self._pending.pop(echo, None)
+        if item is None:
+            return
+        outbox, entry, _ = item
+        outbox.inflight = None
+        if entry.interactive:
+            self._discard(entry, reason)
+        else:
+            self._requeue(outbox, entry)
+        self._wakeup.set()
+
+    def _requeue(self, outbox: _TargetOutbox, entry: _Outgoing):
+        entry.attempts += 1
+        if _max_attempts and entry.attempts >= _max_attempts:
+            self._logger.warning(
+                "OneBot message to %s:%s dropped after %d attempts",
+                outbox.target_type,
+                outbox.target_id,
+                entry.attempts,
+            )
+            self._metric_dropped.inc()
+            self._discard(entry, "too many attempts")
+            return
+        self._metric_retries.inc()
+        delay = min(_retry_max, _retry_base * 2 ** (entry.attempts - 1))
+        entry.ready_at = time.monotonic() + delay * random.uniform(0.8, 1.2)
+        outbox.messages.appendleft(entry)
+        self._queued += 1
+        self._persist(outbox, entry)
+
     async def _recv_loop(self, ws):
         async for message in ws:
             try:
@@ -130,120 +454,89 @@ class OneBotClient:
                 continue
             echo = data.get("echo")
             if echo and echo in self._pending:
-                future = self._pending.pop(echo)
-                if not future.done():
-                    future.set_result(data)
+                self._acknowledge(echo, data)
             else:
                 self._logger.debug("OneBot WS recv event: %s", data.get("post_type"))
 
-    def send_text(self, text: str):
-        if not self.ws_url or not self.target_id:
-            return
-        if not self._queue_ready.wait(timeout=1):
-            return
-        if not self._loop:
-            return
-
+    @staticmethod
+    def _parse_target(target_id):
         try:
-            target = int(self.target_id)
-        except ValueError:
-            return
+            return int(target_id)
+        except (TypeError, ValueError):
+            return None
 
-        if self.target_type == "private":
-            action = "send_private_msg"
-            params = {"user_id": target, "message": text}
+    @staticmethod
+    def _build_payload(target_type: str, target: int, message, echo: str | None = None) -> dict:
+        if target_type == "private":
+            payload = {"action": "send_private_msg", "params": {"user_id": target, "message": message}}
         else:
-            action = "send_group_msg"
-            params = {"group_id": target, "message": text}
-
-        payload = {"action": action, "params": params}
-        self._loop.call_soon_threadsafe(self._queue.put_nowait, payload)
-
-    def send_image_base64(self, image_bytes: bytes, caption: str | None = None):
-        if not self.ws_url or not self.target_id:
-            return
-        if not self._queue_ready.wait(timeout=1):
-            return
-        if not self._loop:
-            return
-
-        try:
-            target = int(self.target_id)
-        except ValueError:
-            return
-
+            payload = {"action": "send_group_msg", "params": {"group_id": target, "message": message}}
+        if echo:
+            payload["echo"] = echo
+        return payload
+
+    # 任意线程调用，只追加到入口缓冲后立即返回句柄，不等待事件循环
+    def submit(self, target_type: str, target_id, message, interactive: bool = False) -> SendHandle:
+        handle = SendHandle()
+        target = self._parse_target(target_id)
+        if target is None:
+            handle.set_result(_failed("invalid_target"))
+            return handle
+        if len(self._intake) >= _INTAKE_LIMIT:
+            self._metric_dropped.inc()
+            handle.set_result(_failed("dropped"))
+            return handle
+        self._intake.append((target_type, target, message, interactive, handle))
+        if self._ready and not self._drain_scheduled:
+            self._drain_scheduled = True
+            self._loop.call_soon_threadsafe(self._drain_intake)
+        return handle
+
+    # 在事件循环线程中把入口缓冲转入各目标队列；先清标记再取，期间新到的消息会再安排一次
+    def _drain_intake(self):
+        self._drain_scheduled = False
+        intake = self._intake
+        while intake:
+            self._enqueue(*intake.popleft())
+
+    def send_text(self, target_type: str, target_id: str, text: str) -> SendHandle:
+        return self.submit(target_type, target_id, text)
+
+    def send_image_base64(
+        self, target_type: str, target_id: str, image_bytes: bytes, caption: str | None = None
+    ) -> SendHandle:
         image_b64 = base64.b64encode(image_bytes).decode("ascii")
         segments = []
         if caption:
             segments.append({"type": "text", "data": {"text": caption}})
         segments.append({"type": "image", "data": {"file": f"base64://{image_b64}"}})
+        return self.submit(target_type, target_id, segments)
 
-        if self.target_type == "private":
-            action = "send_private_msg"
-            params = {"user_id": target, "message": segments}
-        else:
-            action = "send_group_msg"
-            params = {"group_id": target, "message": segments}
-
-        payload = {"action": action, "params": params}
-        self._loop.call_soon_threadsafe(self._queue.put_nowait, payload)
-
-    def send_text_with_result(self, text: str, timeout: int = 5):
-        if not self.ws_url or not self.target_id:
+    def send_text_with_result(self, target_type: str, target_id: str, text: str, timeout: int = 5):
+        if not target_id:
             return {"ok": False, "error": "missing_target"}
-        if not self._queue_ready.wait(timeout=1):
-            return {"ok": False, "error": "queue_not_ready"}
-        if not self._loop:
-            return {"ok": False, "error": "loop_not_ready"}
-
-        try:
-            target = int(self.target_id)
-        except ValueError:
+        if self._parse_target(target_id) is None:
             return {"ok": False, "error": "invalid_target"}
-
-        if self.target_type == "private":
-            action = "send_private_msg"
-            params = {"user_id": target, "message": text}
-        else:
-            action = "send_group_msg"
-            params = {"group_id": target, "message": text}
-
-        echo = uuid.uuid4().hex
-        payload = {"action": action, "params": params, "echo": echo}
-        self._logger.info("OneBot send action=%s target=%s", action, self.target_id)
-        future = asyncio.run_coroutine_threadsafe(
-            self._send_and_wait(payload, timeout),
-            self._loop,
-        )
+        self._logger.info("OneBot send target=%s:%s", target_type, target_id)
+        handle = self.submit(target_type, target_id, text, interactive=True)
         try:
-            return future.result(timeout=timeout + 1)
+            return {"ok": True, "response": handle.result(timeout=timeout)}
         except Exception:
             self._logger.exception("OneBot send wait timeout")
             return {"ok": False, "error": "timeout"}
 
-    async def _send_and_wait(self, payload, timeout: int):
-        echo = payload.get("echo")
-        future = self._loop.create_future()
-        self._pending[echo] = future
-        await self._queue.put(payload)
-        try:
-            response = await asyncio.wait_for(future, timeout=timeout)
-            return {"ok": True, "response": response}
-        except asyncio.TimeoutError:
-            self._pending.pop(echo, None)
-            return {"ok": False, "error": "timeout"}
-
+    # 连接断开时所有等待回执的消息重新排队
     def _fail_pending(self, reason: str):
         if not self._pending:
             return
         self._logger.warning("OneBot pending failed: %s", reason)
-        for echo, future in list(self._pending.items()):
-            if not future.done():
-                future.set_result({"status": "failed", "retcode": -1, "message": reason})
-            self._pending.pop(echo, None)
+        for echo in list(self._pending):
+            self._retry(echo, reason)
 
     def send_player_change(
         self,
+        target_type: str,
+        target_id: str,
         server_name: str,
         joined,
         left,
@@ -262,7 +555,7 @@ class OneBotClient:
             duration_text = format_duration(duration)
             lines.append(f"{name} 下线了({count_text})[在线：{duration_text}]")
         message = f"[{server_name}] " + "，".join(lines)
-        self.send_text(message)
+        return self.send_text(target_type, target_id, message)
 
     @staticmethod
     def _format_count(current: int, maximum: int) -> str:
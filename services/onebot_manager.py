@@ -1,17 +1,75 @@
+import asyncio
 import threading
 
 from services.onebot_client import OneBotClient
 
 
+# 所有 OneBot 连接共用一个事件循环线程，线程数不随绑定数量增长
 class OneBotManager:
-    def __init__(self, default_settings: dict):
+    def __init__(self, default_settings: dict, outbox=None):
         self._default = default_settings
+        self._outbox = outbox
         self._clients = {}
         self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
 
     def start(self):
         # Clients are started on demand.
-        return
+        if self._outbox is not None:
+            self._outbox.start(self._restore)
+
+    def stop(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            loop = self._loop
+            self._loop = None
+        if loop is None:
+            if self._outbox is not None:
+                self._outbox.stop()
+            return
+        # 先在循环内取消并等待各连接任务结束，再停止循环
+        future = asyncio.run_coroutine_threadsafe(self._close_clients(clients), loop)
+        try:
+            future.result(timeout=5)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        # 连接关闭时未确认的消息已重新登记，最后统一写入数据库
+        if self._outbox is not None:
+            self._outbox.stop()
+
+    # 持久化发件箱接手的消息按连接分组交给对应客户端
+    def _restore(self, rows: list):
+        groups = {}
+        for row in rows:
+            groups.setdefault((row["ws_url"], row["access_token"] or ""), []).append(row)
+        for (ws_url, access_token), group in groups.items():
+            client = self._client_for(ws_url, access_token)
+            client.restore(group)
+
+    @staticmethod
+    async def _close_clients(clients):
+        await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+    # 需持有 self._lock
+    def _ensure_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._run_loop, args=(self._loop,), name="onebot", daemon=True
+            )
+            self._thread.start()
+        return self._loop
+
+    @staticmethod
+    def _run_loop(loop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
 
     def resolve_settings(self, settings: dict) -> dict:
         return {
@@ -24,43 +82,47 @@ class OneBotManager:
             "target_id": settings.get("onebot_target_id") or self._default.get("target_id", ""),
         }
 
+    # 连接按 (ws_url, access_token) 复用，目标随每条消息传入
     def _get_client(self, resolved: dict):
         ws_url = resolved.get("ws_url")
         target_id = resolved.get("target_id")
         if not ws_url or not target_id:
             return None
 
-        key = (
-            ws_url,
-            resolved.get("access_token") or "",
-            resolved.get("target_type") or "group",
-            str(target_id),
-        )
+        return self._client_for(ws_url, resolved.get("access_token") or "")
+
+    def _client_for(self, ws_url: str, access_token: str):
+        key = (ws_url, access_token)
         with self._lock:
             client = self._clients.get(key)
             if not client:
                 client = OneBotClient(
                     ws_url=ws_url,
-                    access_token=resolved.get("access_token") or "",
-                    target_type=resolved.get("target_type") or "group",
-                    target_id=str(target_id),
+                    access_token=access_token,
+                    loop=self._ensure_loop(),
+                    store=self._outbox,
                 )
                 client.start()
                 self._clients[key] = client
         return client
 
+    @staticmethod
+    def _target(resolved: dict):
+        return resolved.get("target_type") or "group", str(resolved.get("target_id"))
+
+    # 以下发送接口都不阻塞：消息放入连接的入口缓冲后立即返回可等待的句柄（无可用目标时为 None）
     def send_text(self, settings: dict, text: str):
         resolved = self.resolve_settings(settings)
         client = self._get_client(resolved)
         if client:
-            client.send_text(text)
+            return client.send_text(*self._target(resolved), text)
         return None
 
     def send_image_base64(self, settings: dict, image_bytes: bytes, caption: str | None = None):
         resolved = self.resolve_settings(settings)
         client = self._get_client(resolved)
         if client:
-            client.send_image_base64(image_bytes, caption)
+            return client.send_image_base64(*self._target(resolved), image_bytes, caption)
         return None
 
     def send_text_with_result(self, settings: dict, text: str, timeout: int = 5):
@@ -68,7 +130,7 @@ class OneBotManager:
         client = self._get_client(resolved)
         if not client:
             return {"ok": False, "error": "missing_target"}
-        return client.send_text_with_result(text, timeout=timeout)
+        return client.send_text_with_result(*self._target(resolved), text, timeout=timeout)
 
     def send_player_change(
         self,
@@ -83,7 +145,8 @@ class OneBotManager:
         resolved = self.resolve_settings(settings)
         client = self._get_client(resolved)
         if client:
-            client.send_player_change(
+            return client.send_player_change(
+                *self._target(resolved),
                 server_name,
                 joined,
                 left,
@@ -91,3 +154,4 @@ class OneBotManager:
                 max_count,
                 durations,
             )
+        return None
@@ -0,0 +1,148 @@
+import json
+import logging
+import threading
+
+from sqlalchemy import bindparam, text
+
+from models import db
+
+_COLUMNS = (
+    "key",
+    "owner",
+    "ws_url",
+    "access_token",
+    "target_type",
+    "target_id",
+    "message",
+    "attempts",
+    "created_at",
+)
+_SAVE = text(
+    f"INSERT OR REPLACE INTO onebot_outbox ({', '.join(_COLUMNS)}) "
+    f"VALUES ({', '.join(':' + c for c in _COLUMNS)})"
+)
+_DELETE = text("DELETE FROM onebot_outbox WHERE key IN :keys").bindparams(
+    bindparam("keys", expanding=True)
+)
+# 不属于任何存活监控进程的消息（本进程之前的实例、已失联的其他进程）
+_ORPHANS = text(
+    "SELECT key, owner, ws_url, access_token, target_type, target_id, message, attempts, created_at "
+    "FROM onebot_outbox WHERE owner != :owner "
+    "AND owner NOT IN (SELECT owner FROM monitor_workers) ORDER BY created_at"
+)
+_CLAIM = text("UPDATE onebot_outbox SET owner = :owner WHERE key = :key AND owner = :previous")
+
+
+# OneBot 发件箱的持久化层：内存中的待发队列是它的镜像，发送线程只登记变更，
+# 后台线程每隔 flush_interval 秒合并写入 SQLite；同时定期接手失联进程留下的消息
+class OneBotOutbox:
+    def __init__(self, app, owner: str, flush_interval: float = 0.5, claim_interval: float = 60):
+        self.app = app
+        self.owner = owner
+        self._flush_interval = flush_interval
+        self._claim_interval = claim_interval
+        # key -> 整行（新增或修改）| None（删除），同一条消息多次变更只保留最后一次
+        self._changes = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._on_claim = None
+        self._logger = logging.getLogger("onebot.outbox")
+
+    # on_claim(rows) 在后台线程中调用，rows 为接手的消息，按创建时间排序
+    def start(self, on_claim):
+        if self._thread and self._thread.is_alive():
+            return
+        self._on_claim = on_claim
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def save(
+        self,
+        key: str,
+        ws_url: str,
+        access_token: str,
+        target_type: str,
+        target_id: int,
+        message,
+        attempts: int,
+        created_at: float,
+    ):
+        row = {
+            "key": key,
+            "owner": self.owner,
+            "ws_url": ws_url,
+            "access_token": access_token,
+            "target_type": target_type,
+            "target_id": target_id,
+            "message": message,
+            "attempts": attempts,
+            "created_at": created_at,
+        }
+        with self._lock:
+            self._changes[key] = row
+
+    def delete(self, key: str):
+        with self._lock:
+            self._changes[key] = None
+
+    def _run(self):
+        self._claim_orphans()
+        waited = 0.0
+        while not self._stop.wait(self._flush_interval):
+            self.flush()
+            waited += self._flush_interval
+            if waited >= self._claim_interval:
+                waited = 0.0
+                self._claim_orphans()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                changes = self._changes
+                self._changes = {}
+            if not changes:
+                return
+            rows = []
+            deleted = []
+            for key, row in changes.items():
+                if row is None:
+                    deleted.append(key)
+                else:
+                    rows.append(dict(row, message=json.dumps(row["message"], ensure_ascii=False)))
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as conn:
+                        if rows:
+                            conn.execute(_SAVE, rows)
+                        if deleted:
+                            conn.execute(_DELETE, {"keys": deleted})
+            except Exception:
+                self._logger.exception("OneBot outbox flush failed, retrying later")
+                with self._lock:
+                    # 期间有更新的以新的为准
+                    for key, row in changes.items():
+                        self._changes.setdefault(key, row)
+
+    def _claim_orphans(self):
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    claimed = []
+                    for row in conn.execute(_ORPHANS, {"owner": self.owner}).mappings().all():
+                        taken = conn.execute(
+                            _CLAIM, {"owner": self.owner, "key": row["key"], "previous": row["owner"]}
+                        ).rowcount
+                        if taken:
+                            claimed.append(dict(row, message=json.loads(row["message"])))
+        except Exception:
+            self._logger.exception("Failed to claim OneBot outbox messages")
+            return
+        if claimed:
+            self._logger.info("Resuming %d undelivered OneBot messages", len(claimed))
+            self._on_claim(claimed)
@@ -0,0 +1,75 @@
+import threading
+from types import MappingProxyType
+
+from sqlalchemy.orm import selectinload
+
+from models import Server
+from services.status_store import SERVERS_SIGNAL
+
+_generation = 0
+_generation_lock = threading.Lock()
+_shared_store = None
+
+
+# 监控在独立进程运行时，变更通知改为写入共享存储
+def use_shared_store(store):
+    global _shared_store
+    _shared_store = store
+
+
+# 管理后台修改服务器或绑定后调用，监控线程据此重建快照
+def bump_generation():
+    global _generation
+    with _generation_lock:
+        _generation += 1
+    if _shared_store is not None:
+        _shared_store.signal(SERVERS_SIGNAL)
+
+
+def current_generation() -> int:
+    return _generation
+
+
+def _freeze_binding(b) -> MappingProxyType:
+    return MappingProxyType(
+        {
+            "id": b.id,
+            "name": b.name,
+            "onebot_ws_url": b.onebot_ws_url,
+            "onebot_access_token": b.onebot_access_token,
+            "onebot_target_type": b.onebot_target_type,
+            "onebot_target_id": b.onebot_target_id,
+            "enable_onebot": b.enable_onebot,
+            "notify_player_changes": b.notify_player_changes,
+            "notify_server_status": b.notify_server_status,
+            "bluemap_url": b.bluemap_url,
+            "enable_bluemap": b.enable_bluemap,
+            "send_screenshot": b.send_screenshot,
+        }
+    )
+
+
+def _freeze_server(s) -> MappingProxyType:
+    return MappingProxyType(
+        {
+            "id": s.id,
+            "name": s.name,
+            "host": s.host,
+            "port": s.port,
+            "poll_interval": s.poll_interval,
+            "connect_timeout": s.connect_timeout,
+            "read_timeout": s.read_timeout,
+            "bindings": tuple(_freeze_binding(b) for b in s.bindings),
+        }
+    )
+
+
+# 两条查询取出所有启用的服务器及其绑定，返回只读快照，需在 app context 中调用
+def load_enabled_servers() -> tuple:
+    servers = (
+        Server.query.filter_by(enabled=True)
+        .options(selectinload(Server.bindings))
+        .order_by(Server.id)
+        .all()
+    )
+    return tuple(_freeze_server(s) for s in servers)
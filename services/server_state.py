@@ -0,0 +1,108 @@
+import json
+import os
+import sys
+from array import array
+from bisect import bisect_left
+
+_NO_PLAYERS = frozenset()
+_SNAPSHOT_VERSION = 1
+
+
+def intern_name(name: str) -> str:
+    return sys.intern(name)
+
+
+# 单台服务器的监控状态；玩家上线时间按名字排序存成 (tuple, array) 两列，避免每台服务器一个 dict
+class ServerState:
+    __slots__ = (
+        "last_count",
+        "last_online",
+        "offline_since",
+        "last_change_at",
+        "players",
+        "_seen_names",
+        "_seen_times",
+    )
+
+    def __init__(self):
+        self.last_count = None
+        self.last_online = None
+        self.offline_since = None
+        self.last_change_at = 0.0
+        self.players = _NO_PLAYERS
+        self._seen_names = ()
+        self._seen_times = array("d")
+
+    def seen_at(self, name: str, default: float) -> float:
+        names = self._seen_names
+        index = bisect_left(names, name)
+        if index < len(names) and names[index] == name:
+            return self._seen_times[index]
+        return default
+
+    def seen_dict(self) -> dict:
+        return dict(zip(self._seen_names, self._seen_times))
+
+    def store_seen(self, seen: dict):
+        names = tuple(sorted(seen))
+        self._seen_names = names
+        self._seen_times = array("d", (seen[name] for name in names))
+
+    def clear_players(self):
+        self.players = _NO_PLAYERS
+        self._seen_names = ()
+        self._seen_times = array("d")
+
+    # 紧凑的列表形式，用于写入磁盘快照
+    def to_record(self) -> list:
+        return [
+            self.last_count,
+            self.last_online,
+            self.offline_since,
+            self.last_change_at,
+            sorted(self.players),
+            list(self._seen_names),
+            self._seen_times.tolist(),
+        ]
+
+    @classmethod
+    def from_record(cls, record: list) -> "ServerState":
+        state = cls()
+        last_count, last_online, offline_since, last_change_at, players, names, times = record
+        state.last_count = last_count
+        state.last_online = last_online
+        state.offline_since = offline_since
+        state.last_change_at = last_change_at or 0.0
+        state.players = frozenset(intern_name(name) for name in players)
+        state.store_seen(dict(zip((intern_name(name) for name in names), times)))
+        return state
+
+
+# 先写临时文件再替换，进程中途退出也不会留下半个快照
+def save_states(path: str, states: dict, now: float):
+    payload = {
+        "version": _SNAPSHOT_VERSION,
+        "saved_at": now,
+        "servers": {str(sid): state.to_record() for sid, state in states.items()},
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+# 快照不存在、版本不符或超过 max_age 秒时返回空 dict
+def load_states(path: str, max_age: float, now: float) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if payload.get("version") != _SNAPSHOT_VERSION:
+        return {}
+    if now - float(payload.get("saved_at") or 0) > max_age:
+        return {}
+    return {
+        int(sid): ServerState.from_record(record)
+        for sid, record in (payload.get("servers") or {}).items()
+    }
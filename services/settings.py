@@ -0,0 +1,67 @@
+import os
+
+import config
+
+# 可选配置项的默认值，与 example.config.py 保持一致；
+# 升级后沿用旧的 config.py 时，缺少的项取这里的值，不会在启动时因导入失败退出
+DEFAULTS = {
+    "POLL_INTERVAL": 10,
+    "POLL_INTERVAL_ACTIVE": 5,
+    "POLL_ACTIVE_WINDOW": 60,
+    "POLL_INTERVAL_IDLE": 20,
+    "POLL_JITTER": 0.1,
+    "POLL_CONCURRENCY": 32,
+    "SERVER_SNAPSHOT_RECHECK": 60,
+    "STATE_SNAPSHOT_PATH": os.path.join(os.path.dirname(os.path.abspath(config.__file__)), "monitor_state.json"),
+    "STATE_SNAPSHOT_INTERVAL": 60,
+    "STATE_SNAPSHOT_MAX_AGE": 300,
+    "PROBE_CONNECT_TIMEOUT": 3,
+    "PROBE_READ_TIMEOUT": 3,
+    "BREAKER_FAILURE_THRESHOLD": 3,
+    "BREAKER_OPEN_SECONDS": 15,
+    "BREAKER_MAX_OPEN_SECONDS": 60,
+    "HISTORY_ENABLED": True,
+    "HISTORY_FLUSH_INTERVAL": 5,
+    "HISTORY_RETENTION_DAYS": 30,
+    "HISTORY_ROLLUP_RETENTION_DAYS": 365,
+    "MONITOR_MODE": "embedded",
+    "STATUS_STORE_POLL_INTERVAL": 1,
+    "MONITOR_LEASE_SECONDS": 15,
+    "POLL_TRACE_SLOW_SECONDS": 0,
+    "POLL_PROFILE_SECONDS": 10,
+    "METRICS_ENABLED": True,
+    "METRICS_PORT": 0,
+    "ONEBOT_COALESCE_SECONDS": 1,
+    "ONEBOT_TARGET_RATE_PER_MINUTE": 20,
+    "ONEBOT_TARGET_BURST": 5,
+    "ONEBOT_CONNECTION_RATE_PER_MINUTE": 60,
+    "ONEBOT_CONNECTION_BURST": 10,
+    "ONEBOT_TARGET_QUEUE_LIMIT": 100,
+    "ONEBOT_OVERFLOW_POLICY": "drop_oldest",
+    "ONEBOT_OUTBOX_ENABLED": True,
+    "ONEBOT_ACK_TIMEOUT": 30,
+    "ONEBOT_RETRY_BASE_SECONDS": 2,
+    "ONEBOT_RETRY_MAX_SECONDS": 300,
+    "ONEBOT_MAX_ATTEMPTS": 10,
+    "QUERY_MAX_AGE": 60,
+    "QUERY_TOKEN_TTL": 25,
+    "QUERY_TIMEOUT": 2,
+    "DNS_CACHE_TTL": 300,
+    "DNS_NEGATIVE_TTL": 60,
+}
+
+
+def setting(name: str):
+    return getattr(config, name, DEFAULTS[name])
+
+
+# 数值型配置：无法解析时取默认值，负数按 0 处理；positive=True 时 0 也取默认值
+def number(name: str, positive: bool = False) -> float:
+    default = float(DEFAULTS[name])
+    try:
+        value = max(0.0, float(setting(name)))
+    except (TypeError, ValueError):
+        return default
+    if positive and value == 0:
+        return default
+    return value
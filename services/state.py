@@ -1,19 +1,249 @@
+import hashlib
+import json
 import threading
+from collections import deque
+from types import MappingProxyType
+from typing import NamedTuple
 
-_status_cache = {}
-_cache_lock = threading.Lock()
+
+# 不可变的状态快照：读者直接取 _snapshot 引用，无需加锁，且总能看到完整一轮的结果
+class StatusSnapshot(NamedTuple):
+    generation: int
+    statuses: MappingProxyType
+    generations: MappingProxyType
+
+
+_EMPTY = MappingProxyType({})
+_snapshot = StatusSnapshot(0, _EMPTY, _EMPTY)
+# 写入方先暂存本轮更新，commit_status 时复制一份新映射整体替换；锁只在写入方之间使用
+_pending = {}
+_write_lock = threading.Lock()
+
+# 全局代数每次状态变化加一，并记到对应服务器上；删除的服务器留下墓碑
+_generation = 0
+_tombstones = {}
+_tombstone_floor = 0
+_TOMBSTONE_LIMIT = 1024
+
+# 监控线程每轮发布的 /api/servers 响应体：(版本号, ETag, 已序列化的 bytes, 代数)
+_payload = None
+# 与响应体同一时刻的增量视图：(代数, 墓碑下限, [(服务器代数, 条目)], ((id, 代数), ...))
+_published = None
+_published_entries = {}
+_payload_lock = threading.Lock()
+
+_subscribers = set()
+_subscribers_lock = threading.Lock()
 
 
 def update_status(server_id, status):
-    with _cache_lock:
-        _status_cache[server_id] = status
+    global _generation
+    with _write_lock:
+        _generation += 1
+        _pending[server_id] = (_generation, MappingProxyType(dict(status)))
+    if _subscribers:
+        data = dict(status_fields(status), id=server_id)
+        _broadcast(sse_message("server", json.dumps(data, ensure_ascii=False, separators=(",", ":"))))
 
 
 def get_status(server_id):
-    with _cache_lock:
-        return _status_cache.get(server_id)
+    return _snapshot.statuses.get(server_id)
 
 
 def all_status():
-    with _cache_lock:
-        return dict(_status_cache)
+    return _snapshot.statuses
+
+
+# 把暂存的更新合并进新快照并原子替换引用，监控线程每轮结束调用一次；
+# stamped 为新增或改名时提升的 {id: 代数}，同样记入各服务器的代数
+def commit_status(removed=(), stamped=None) -> StatusSnapshot:
+    global _snapshot, _pending
+    with _write_lock:
+        if not _pending and not removed and _generation == _snapshot.generation:
+            return _snapshot
+        statuses = dict(_snapshot.statuses)
+        generations = dict(_snapshot.generations)
+        for sid, (gen, status) in _pending.items():
+            statuses[sid] = status
+            generations[sid] = gen
+        for sid, gen in (stamped or {}).items():
+            if gen > generations.get(sid, 0):
+                generations[sid] = gen
+        for sid in removed:
+            statuses.pop(sid, None)
+            generations.pop(sid, None)
+        _pending = {}
+        _snapshot = StatusSnapshot(
+            _generation, MappingProxyType(statuses), MappingProxyType(generations)
+        )
+        return _snapshot
+
+
+def server_entry(server_id: int, name: str, address: str, status) -> dict:
+    entry = {"id": server_id, "name": name, "address": address}
+    entry.update(status_fields(status))
+    return entry
+
+
+def status_fields(status) -> dict:
+    status = status or {}
+    return {
+        "online": status.get("online", False),
+        "players_online": status.get("players_online", 0),
+        "players_max": status.get("players_max", 0),
+        "latency_ms": status.get("latency_ms"),
+        "players": status.get("players", []),
+        "players_display": status.get("players_display", []),
+        "players_known": status.get("players_known", False),
+        "checked_at": status.get("checked_at"),
+        "breaker": status.get("breaker"),
+    }
+
+
+# 内容不变时保持原版本号与 ETag，客户端可直接得到 304
+def publish_payload(entries: list) -> bool:
+    global _payload, _published, _published_entries
+    body = json.dumps(entries, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+    with _payload_lock:
+        if _payload is not None and _payload[1] == etag:
+            return False
+        servers_changed, generation, floor, gens, tombstones = _stamp_entries(entries)
+        version = _payload[0] + 1 if _payload is not None else 1
+        _payload = (version, etag, body, generation)
+        _published = (
+            generation,
+            floor,
+            [(gens.get(entry["id"], 0), entry) for entry in entries],
+            tombstones,
+        )
+        _published_entries = {entry["id"]: entry for entry in entries}
+    # 服务器增删改名时推送整份快照，单台状态变化由 update_status 逐条推送
+    if servers_changed and _subscribers:
+        _broadcast(sse_message("snapshot", body.decode("utf-8")))
+    return True
+
+
+# Web 进程从共享存储装入监控进程发布的结果，并把其中的变化推送给本进程的 SSE 订阅者
+def install_published(payload: tuple, published: tuple):
+    global _payload, _published, _published_entries
+    with _payload_lock:
+        previous = _published
+        _payload = payload
+        _published = published
+        _published_entries = {entry["id"]: entry for _, entry in published[2]}
+    if not _subscribers:
+        return
+    ids = [entry["id"] for _, entry in published[2]]
+    if (
+        previous is None
+        or published[0] < previous[0]
+        or ids != [entry["id"] for _, entry in previous[2]]
+    ):
+        _broadcast(sse_message("snapshot", payload[2].decode("utf-8")))
+        return
+    for gen, entry in published[2]:
+        if gen > previous[0]:
+            _broadcast(
+                sse_message("server", json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+            )
+
+
+# 新增或改名的服务器提升代数，消失的服务器记墓碑并从快照中移除；需持有 _payload_lock
+def _stamp_entries(entries: list):
+    global _generation, _tombstone_floor
+    previous = _published_entries
+    ids = {entry["id"] for entry in entries}
+    renamed = {}
+    removed = [sid for sid in previous if sid not in ids]
+    with _write_lock:
+        for entry in entries:
+            old = previous.get(entry["id"])
+            if old is None or old["name"] != entry["name"] or old["address"] != entry["address"]:
+                _generation += 1
+                renamed[entry["id"]] = _generation
+                _tombstones.pop(entry["id"], None)
+        for sid in removed:
+            _generation += 1
+            _tombstones[sid] = _generation
+            _pending.pop(sid, None)
+        while len(_tombstones) > _TOMBSTONE_LIMIT:
+            sid = min(_tombstones, key=_tombstones.get)
+            _tombstone_floor = max(_tombstone_floor, _tombstones.pop(sid))
+        tombstones = tuple(_tombstones.items())
+        floor = _tombstone_floor
+    snapshot = commit_status(removed, renamed)
+    gens = {sid: snapshot.generations.get(sid, 0) for sid in ids}
+    changed = bool(renamed or removed)
+    return changed, snapshot.generation, floor, gens, tombstones
+
+
+# 返回自 since 代之后变化的服务器与已删除的 id；since 无法增量衔接时返回全量
+def delta_since(since: int):
+    published = _published
+    if published is None:
+        return None
+    generation, floor, entries, tombstones = published
+    full = since > generation or since < floor
+    return {
+        "generation": generation,
+        "full": full,
+        "servers": [entry for gen, entry in entries if full or gen > since],
+        "removed": [] if full else [sid for sid, gen in tombstones if gen > since],
+    }
+
+
+def get_payload():
+    return _payload
+
+
+def sse_message(event: str, data: str) -> bytes:
+    return f"event: {event}\ndata: {data}\n\n".encode("utf-8")
+
+
+# 每个 SSE 连接一个有界缓冲；客户端跟不上时丢弃积压并改发整份快照
+class Subscriber:
+    def __init__(self, limit: int = 256):
+        self._limit = limit
+        self._messages = deque()
+        self._resync = False
+        self._cond = threading.Condition()
+
+    def push(self, message: bytes):
+        with self._cond:
+            if len(self._messages) >= self._limit:
+                self._messages.clear()
+                self._resync = True
+            else:
+                self._messages.append(message)
+            self._cond.notify()
+
+    # 返回 (消息列表, 是否需要重发快照)，超时返回空列表
+    def drain(self, timeout: float):
+        with self._cond:
+            if not self._messages and not self._resync:
+                self._cond.wait(timeout)
+            messages = list(self._messages)
+            self._messages.clear()
+            resync = self._resync
+            self._resync = False
+        return messages, resync
+
+
+def subscribe() -> Subscriber:
+    subscriber = Subscriber()
+    with _subscribers_lock:
+        _subscribers.add(subscriber)
+    return subscriber
+
+
+def unsubscribe(subscriber: Subscriber):
+    with _subscribers_lock:
+        _subscribers.discard(subscriber)
+
+
+def _broadcast(message: bytes):
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for subscriber in subscribers:
+        subscriber.push(message)
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from sqlalchemy import text
+
+from models import db
+from services.state import install_published
+
+SERVERS_SIGNAL = "servers"
+RESET_ALL_SIGNAL = "reset:all"
+STATUS_GENERATION = "status_generation"
+
+_TOMBSTONE_LIMIT = 1024
+
+_BUMP_SIGNAL = text(
+    "INSERT INTO monitor_signals (name, value) VALUES (:name, 1) "
+    "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+)
+_READ_SIGNAL = text("SELECT value FROM monitor_signals WHERE name = :name")
+_UPSERT_STATUS = text(
+    "INSERT OR REPLACE INTO server_status (server_id, generation, entry, updated_at) "
+    "VALUES (:server_id, :generation, :entry, :updated_at)"
+)
+
+
+def reset_signal(server_id: int) -> str:
+    return f"reset:{server_id}"
+
+
+# 在已开启的写事务中递增全局状态代数并返回新值（先写后读，多个进程之间由 SQLite 写锁串行化）
+def next_status_generation(conn) -> int:
+    conn.execute(_BUMP_SIGNAL, {"name": STATUS_GENERATION})
+    return conn.execute(_READ_SIGNAL, {"name": STATUS_GENERATION}).scalar()
+
+
+# 监控进程与 Web 进程之间通过数据库共享状态：监控进程按服务器写 server_status，
+# Web 进程写 monitor_signals；SQLite 使用 WAL，读写互不阻塞
+class SharedStatusStore:
+    def __init__(self, app, poll_interval: float = 1.0):
+        self.app = app
+        self._poll_interval = poll_interval
+        with app.app_context():
+            self._engine = db.engine
+        if self._engine.dialect.name == "sqlite":
+            with self._engine.connect() as conn:
+                conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+        self._thread = None
+        self._stop = threading.Event()
+        self._logger = logging.getLogger("status_store")
+        # Web 进程侧跟随到的状态：代数、id -> (代数, 条目)、墓碑
+        self._generation = 0
+        self._entries = {}
+        self._tombstones = {}
+        self._floor = 0
+        self._version = 0
+
+    @property
+    def engine(self):
+        return self._engine
+
+    # 监控进程：写入本轮探测过的服务器，整批共用一个新代数
+    def publish_entries(self, entries: list):
+        if not entries:
+            return
+        now = time.time()
+        with self._engine.begin() as conn:
+            generation = next_status_generation(conn)
+            conn.execute(
+                _UPSERT_STATUS,
+                [
+                    {
+                        "server_id": entry["id"],
+                        "generation": generation,
+                        "entry": json.dumps(entry, ensure_ascii=False, separators=(",", ":")),
+                        "updated_at": now,
+                    }
+                    for entry in entries
+                ],
+            )
+
+    # Web 进程：后台线程跟随监控进程的发布
+    def follow(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._follow_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _follow_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.load()
+            except Exception:
+                self._logger.exception("Failed to load shared status")
+            self._stop.wait(self._poll_interval)
+
+    # 代数没变时只有一次主键查找；变化时只取新写入的行，条目数对不上时再核对 id 列表
+    def load(self) -> bool:
+        with self._engine.connect() as conn:
+            generation = conn.execute(_READ_SIGNAL, {"name": STATUS_GENERATION}).scalar() or 0
+            if generation == self._generation:
+                return False
+            if generation < self._generation:
+                # 计数器被重置（例如换了数据库），整体重新加载
+                self._entries = {}
+                self._tombstones = {}
+            rows = conn.execute(
+                text(
+                    "SELECT server_id, generation, entry FROM server_status "
+                    "WHERE generation > :since"
+                ),
+                {"since": self._generation if self._entries else -1},
+            ).fetchall()
+            for server_id, gen, entry in rows:
+                self._entries[server_id] = (gen, json.loads(entry))
+                self._tombstones.pop(server_id, None)
+            count = conn.execute(text("SELECT COUNT(*) FROM server_status")).scalar()
+            if count != len(self._entries):
+                ids = {row[0] for row in conn.execute(text("SELECT server_id FROM server_status"))}
+                for server_id in list(self._entries):
+                    if server_id not in ids:
+                        del self._entries[server_id]
+                        self._tombstones[server_id] = generation
+        while len(self._tombstones) > _TOMBSTONE_LIMIT:
+            server_id = min(self._tombstones, key=self._tombstones.get)
+            self._floor = max(self._floor, self._tombstones.pop(server_id))
+        self._generation = generation
+        self._install()
+        return True
+
+    def _install(self):
+        ordered = [self._entries[sid] for sid in sorted(self._entries, reverse=True)]
+        body = json.dumps(
+            [entry for _, entry in ordered], ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        self._version += 1
+        install_published(
+            (self._version, etag, body, self._generation),
+            (self._generation, self._floor, ordered, tuple(self._tombstones.items())),
+        )
+
+    def signal(self, name: str):
+        with self._engine.begin() as conn:
+            conn.execute(_BUMP_SIGNAL, {"name": name})
+
+    def signals(self) -> dict:
+        with self._engine.connect() as conn:
+            return dict(conn.execute(text("SELECT name, value FROM monitor_signals")).fetchall())
+
+    # 与 ServerMonitor.reset_players 同名，Web 进程的管理后台无需区分运行模式
+    def reset_players(self, server_id: int | None = None):
+        self.signal(RESET_ALL_SIGNAL if server_id is None else reset_signal(server_id))
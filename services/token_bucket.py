@@ -0,0 +1,32 @@
+import time
+
+
+# 令牌桶限速：每分钟补充 per_minute 个令牌，最多攒 burst 个；per_minute <= 0 表示不限速
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60 if per_minute > 0 else 0.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # 距离下一个令牌可用还需等待的秒数，0 表示现在即可发送
+    def wait_time(self, now: float) -> float:
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        if not self.rate:
+            return
+        self._refill(now)
+        self.tokens -= 1
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+SNAPSHOT = "snapshot"
+PROBE = "probe"
+DIFF = "diff"
+NOTIFY = "notify"
+UPDATE_STATUS = "update_status"
+PUBLISH = "publish"
+PHASES = (SNAPSHOT, PROBE, DIFF, NOTIFY, UPDATE_STATUS, PUBLISH)
+
+_SLOWEST_PROBES = 5
+
+
+# 一轮轮询的分阶段计时：任一时刻只处于一个阶段，switch 时把上一段耗时记到旧阶段上，
+# 嵌套调用（例如处理状态时插入的推送）用返回值切回原阶段
+class CycleTrace:
+    __slots__ = ("started_at", "phase", "durations", "probes", "_started", "_mark")
+
+    def __init__(self, now: float):
+        self.started_at = now
+        self.phase = None
+        self.durations = dict.fromkeys(PHASES, 0.0)
+        # (服务器 id, 地址, 耗时, DNS 耗时, 是否在线)
+        self.probes = []
+        self._started = self._mark = time.perf_counter()
+
+    def switch(self, phase):
+        mark = time.perf_counter()
+        previous = self.phase
+        if previous is not None:
+            self.durations[previous] += mark - self._mark
+        self.phase = phase
+        self._mark = mark
+        return previous
+
+    def finish(self) -> float:
+        self.switch(None)
+        return time.perf_counter() - self._started
+
+    def record(self, total: float) -> dict:
+        slowest = sorted(self.probes, key=lambda p: p[2], reverse=True)[:_SLOWEST_PROBES]
+        return {
+            "started_at": datetime.utcfromtimestamp(self.started_at).isoformat() + "Z",
+            "total_ms": round(total * 1000, 1),
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.durations.items()},
+            "probed": len(self.probes),
+            "slowest": [
+                {
+                    "id": sid,
+                    "address": address,
+                    "ms": round(seconds * 1000, 1),
+                    "dns_ms": round(dns * 1000, 1),
+                    "online": online,
+                }
+                for sid, address, seconds, dns, online in slowest
+            ],
+        }
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+# 定时采样指定线程的调用栈，返回 collapsed 格式（每行“栈;…;栈 次数”），
+# 可直接交给 flamegraph.pl 或 speedscope 生成火焰图
+def sample_stacks(thread_id: int, seconds: float, interval: float = 0.01) -> str:
+    stacks = Counter()
+    labels = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = _frame_label(code)
+            names.append(label)
+            frame = frame.f_back
+        stacks[";".join(reversed(names))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -1,6 +1,29 @@
 const container = document.getElementById("server-list");
 let hasRendered = false;
 const cards = new Map();
+const HISTORY_REFRESH_MS = 10 * 60 * 1000;
+const HISTORY_TICK_MS = 2000;
+const HISTORY_BATCH = 4;
+let historyLoading = false;
+let serversEtag = null;
+let statusGeneration = null;
+let streaming = false;
+const serversById = new Map();
+// 只为出现在视口中的卡片加载历史汇总；浏览器不支持时视为全部可见
+const visibleIds = new Set();
+const historyObserver = window.IntersectionObserver
+  ? new IntersectionObserver((items) => {
+      items.forEach((item) => {
+        const id = Number(item.target.dataset.id);
+        if (item.isIntersecting) {
+          visibleIds.add(id);
+        } else {
+          visibleIds.delete(id);
+        }
+      });
+      refreshHistory();
+    })
+  : null;
 
 function createElement(tag, className, text) {
   const el = document.createElement(tag);
@@ -26,6 +49,7 @@ function ensureCard(server) {
   if (entry) return entry;
 
   const card = createElement("article", "card");
+  card.dataset.id = server.id;
   const header = createElement("div", "card-header");
   const title = createElement("h3", null, "");
   const badge = createElement("span", "status", "");
@@ -44,12 +68,19 @@ function ensureCard(server) {
   stats.appendChild(count);
   stats.appendChild(checked);
 
+  const history = createElement("div", "stats");
+  const uptime = createElement("div", "stat", "7天在线率：-");
+  const peak = createElement("div", "stat", "7天峰值：-");
+  history.appendChild(uptime);
+  history.appendChild(peak);
+
   const playersTitle = createElement("div", "players-title", "玩家列表");
   const playersList = createElement("div", "players");
 
   card.appendChild(header);
   card.appendChild(meta);
   card.appendChild(stats);
+  card.appendChild(history);
   card.appendChild(playersTitle);
   card.appendChild(playersList);
 
@@ -61,13 +92,25 @@ function ensureCard(server) {
     latency,
     count,
     checked,
+    uptime,
+    peak,
     playersList,
     lastPlayersKey: "",
+    historyLoadedAt: 0,
   };
   cards.set(server.id, entry);
+  if (historyObserver) historyObserver.observe(card);
   return entry;
 }
 
+function dropCard(id) {
+  const entry = cards.get(id);
+  if (!entry) return;
+  if (historyObserver) historyObserver.unobserve(entry.card);
+  visibleIds.delete(id);
+  cards.delete(id);
+}
+
 function updatePlayers(entry, server) {
   const displayPlayers =
     server.players_display && server.players_display.length
@@ -110,6 +153,43 @@ function updateCard(entry, server) {
   updatePlayers(entry, server);
 }
 
+async function loadHistory(entry, serverId) {
+  entry.historyLoadedAt = Date.now();
+  try {
+    const res = await fetch(`/api/servers/${serverId}/history?range=7d`, { cache: "no-store" });
+    if (!res.ok) return;
+    const data = await res.json();
+    const summary = data.summary || {};
+    entry.uptime.textContent = `7天在线率：${
+      summary.uptime === null || summary.uptime === undefined ? "-" : `${summary.uptime}%`
+    }`;
+    entry.peak.textContent = `7天峰值：${summary.samples ? summary.peak_players : "-"}`;
+  } catch (err) {
+    console.error(err);
+  }
+}
+
+// 汇总数据变化缓慢：定时检查，与卡片由轮询还是 SSE 更新无关；
+// 每次只为可见且已过期的卡片请求，最多 HISTORY_BATCH 张，上一批完成前不发新请求
+async function refreshHistory() {
+  if (historyLoading) return;
+  const now = Date.now();
+  const due = [];
+  for (const [id, entry] of cards) {
+    if (historyObserver && !visibleIds.has(id)) continue;
+    if (now - entry.historyLoadedAt < HISTORY_REFRESH_MS) continue;
+    due.push(loadHistory(entry, id));
+    if (due.length >= HISTORY_BATCH) break;
+  }
+  if (!due.length) return;
+  historyLoading = true;
+  try {
+    await Promise.all(due);
+  } finally {
+    historyLoading = false;
+  }
+}
+
 function renderServers(servers) {
   if (servers.length === 1) {
     container.classList.add("single");
@@ -120,13 +200,15 @@ function renderServers(servers) {
   if (!servers.length) {
     container.classList.remove("single");
     container.replaceChildren(createElement("div", "empty", "暂无服务器，请先登录添加。"));
-    cards.clear();
+    Array.from(cards.keys()).forEach(dropCard);
     return;
   }
 
   const fragment = document.createDocumentFragment();
   const seen = new Set();
+  serversById.clear();
   servers.forEach((server) => {
+    serversById.set(server.id, server);
     const entry = ensureCard(server);
     updateCard(entry, server);
     fragment.appendChild(entry.card);
@@ -134,9 +216,9 @@ function renderServers(servers) {
   });
   container.replaceChildren(fragment);
 
-  for (const id of cards.keys()) {
-    if (!seen.has(id)) cards.delete(id);
-  }
+  Array.from(cards.keys()).forEach((id) => {
+    if (!seen.has(id)) dropCard(id);
+  });
 
   if (!hasRendered) {
     hasRendered = true;
@@ -145,9 +227,53 @@ function renderServers(servers) {
   }
 }
 
+// 增量结果：只更新变化的卡片，有增删时才按 id 重新排列
+function applyDelta(delta) {
+  statusGeneration = delta.generation;
+  if (delta.full) {
+    renderServers(delta.servers);
+    return;
+  }
+  let reorder = false;
+  delta.removed.forEach((id) => {
+    if (serversById.delete(id)) reorder = true;
+  });
+  delta.servers.forEach((server) => {
+    if (!serversById.has(server.id)) reorder = true;
+    serversById.set(server.id, server);
+  });
+  if (reorder) {
+    renderServers(Array.from(serversById.values()).sort((a, b) => b.id - a.id));
+    return;
+  }
+  delta.servers.forEach((server) => {
+    const entry = cards.get(server.id);
+    if (entry) updateCard(entry, server);
+  });
+}
+
 async function loadServers() {
   try {
-    const res = await fetch("/api/servers", { cache: "no-store" });
+    // 增量请求同样带 If-None-Match，没有新变化时服务端返回 304
+    const headers = serversEtag ? { "If-None-Match": serversEtag } : {};
+    if (statusGeneration !== null) {
+      const res = await fetch(`/api/servers?since=${statusGeneration}`, { cache: "no-store", headers });
+      if (res.status === 304) return;
+      serversEtag = res.headers.get("ETag");
+      const data = await res.json();
+      if (!Array.isArray(data)) {
+        applyDelta(data);
+        return;
+      }
+      statusGeneration = null;
+      renderServers(data);
+      return;
+    }
+    const res = await fetch("/api/servers", { cache: "no-store", headers });
+    if (res.status === 304) return;
+    serversEtag = res.headers.get("ETag");
+    const generation = res.headers.get("X-Status-Generation");
+    statusGeneration = generation === null ? null : Number(generation);
     const data = await res.json();
     renderServers(data);
   } catch (err) {
@@ -155,5 +281,35 @@ async function loadServers() {
   }
 }
 
+// 单台服务器状态推送：合并到已有数据后只更新对应卡片
+function applyServerUpdate(patch) {
+  const server = serversById.get(patch.id);
+  if (!server) return;
+  Object.assign(server, patch);
+  const entry = cards.get(patch.id);
+  if (!entry) return;
+  updateCard(entry, server);
+}
+
+function connectStream() {
+  if (!window.EventSource) return;
+  const source = new EventSource("/api/stream");
+  source.addEventListener("snapshot", (event) => {
+    streaming = true;
+    renderServers(JSON.parse(event.data));
+  });
+  source.addEventListener("server", (event) => {
+    applyServerUpdate(JSON.parse(event.data));
+  });
+  // 连接断开期间回退到轮询，EventSource 会自动重连
+  source.onerror = () => {
+    streaming = false;
+  };
+}
+
 loadServers();
-setInterval(loadServers, 5000);
+connectStream();
+setInterval(() => {
+  if (!streaming) loadServers();
+}, 5000);
+setInterval(refreshHistory, HISTORY_TICK_MS);
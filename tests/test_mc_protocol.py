@@ -0,0 +1,150 @@
+import asyncio
+import json
+
+import pytest
+
+from services import mc_protocol
+
+_STATUS = {
+    "version": {"name": "1.20", "protocol": 763},
+    "players": {
+        "online": 3,
+        "max": 10,
+        "sample": [{"name": "a", "id": "00000000-0000-0000-0000-000000000000"}],
+    },
+    "description": "test",
+}
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+async def _read_varint(reader) -> int:
+    value = 0
+    for i in range(5):
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return value
+    raise ValueError("varint too long")
+
+
+# 最小的状态服务器：记录握手里的主机名，按顺序回应状态请求与 ping
+async def _start_status_server(hosts: list, oversized: bool = False):
+    async def handle(reader, writer):
+        packet = await reader.readexactly(await _read_varint(reader))
+        index = 1
+        while packet[index] & 0x80:
+            index += 1
+        index += 1
+        hosts.append(packet[index + 1 : index + 1 + packet[index]].decode())
+        await reader.readexactly(await _read_varint(reader))
+        if oversized:
+            writer.write(_varint(mc_protocol.MAX_PACKET_BYTES + 1) + b"\x00" * 64)
+            await writer.drain()
+            writer.close()
+            return
+        body = json.dumps(_STATUS).encode()
+        payload = _varint(0) + _varint(len(body)) + body
+        writer.write(_varint(len(payload)) + payload)
+        ping = await reader.readexactly(await _read_varint(reader))
+        writer.write(_varint(len(ping)) + ping)
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+class _QueryProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.handshakes = 0
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        session_id = data[3:7]
+        if data[2] == 9:
+            self.handshakes += 1
+            self.transport.sendto(bytes([9]) + session_id + b"12345\x00", addr)
+            return
+        kv = (
+            b"splitnum\x00\x80\x00hostname\x00test\x00gametype\x00SMP\x00game_id\x00MINECRAFT\x00"
+            b"version\x001.20\x00plugins\x00\x00map\x00world\x00numplayers\x003\x00"
+            b"maxplayers\x0010\x00hostport\x0025565\x00hostip\x00127.0.0.1\x00\x00"
+        )
+        self.transport.sendto(bytes([0]) + session_id + kv + b"\x01player_\x00\x00a\x00b\x00c\x00\x00", addr)
+
+
+# 内部模块改名或移动时这里直接失败，提醒同步更新 mc_protocol.py
+def test_mcstatus_internals_available():
+    assert mc_protocol.INTERNALS_AVAILABLE, "mcstatus internals moved; update services/mc_protocol.py"
+
+
+def test_status_handshake_uses_original_host():
+    hosts = []
+
+    async def run():
+        server, port = await _start_status_server(hosts)
+        async with server:
+            return await mc_protocol.async_read_status("127.0.0.1", port, "play.example.com", 2, 2)
+
+    result = asyncio.run(run())
+    assert hosts == ["play.example.com"]
+    assert result["players_online"] == 3
+    assert result["sample"] == ["a"]
+    assert result["latency_ms"] is not None
+
+
+def test_oversized_packet_is_refused():
+    async def run():
+        server, port = await _start_status_server([], oversized=True)
+        async with server:
+            await mc_protocol.async_read_status("127.0.0.1", port, "localhost", 2, 2)
+
+    with pytest.raises(OSError):
+        asyncio.run(run())
+
+
+def test_query_session_reuses_token():
+    async def run():
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.create_datagram_endpoint(
+            _QueryProtocol, local_addr=("127.0.0.1", 0)
+        )
+        port = transport.get_extra_info("sockname")[1]
+        session = mc_protocol.QuerySession("127.0.0.1", port, token_ttl=25)
+        try:
+            first = await session.read_players(2)
+            second = await session.read_players(2)
+        finally:
+            session.close()
+            transport.close()
+        return first, second, protocol.handshakes
+
+    first, second, handshakes = asyncio.run(run())
+    assert first == second == ["a", "b", "c"]
+    assert handshakes == 1
+
+
+def test_public_api_fallback(monkeypatch):
+    monkeypatch.setattr(mc_protocol, "INTERNALS_AVAILABLE", False)
+
+    async def run():
+        server, port = await _start_status_server([])
+        async with server:
+            return await mc_protocol.async_read_status("127.0.0.1", port, "localhost", 2, 2)
+
+    result = asyncio.run(run())
+    assert result["players_online"] == 3
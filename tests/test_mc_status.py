@@ -0,0 +1,35 @@
+import asyncio
+import socket
+import time
+
+from services import mc_status
+
+
+def _closed_port() -> int:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+# 状态端口拒绝连接时不能等 Query 超时，也不能留下未读取异常的任务
+def test_closed_port_with_query_returns_quickly():
+    port = _closed_port()
+    errors = []
+
+    async def probe():
+        loop = asyncio.get_running_loop()
+        loop.set_exception_handler(lambda _loop, context: errors.append(context))
+        started = time.perf_counter()
+        status = await mc_status.async_fetch_status("127.0.0.1", port, True, 0)
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(0.05)
+        mc_status.close_query_sessions(loop)
+        return status, elapsed
+
+    for _ in range(2):
+        status, elapsed = asyncio.run(probe())
+        assert status["online"] is False
+        assert elapsed < 0.5
+    assert errors == []